@@ -59,9 +59,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # IMMEDIATE makes every atomic block take SQLite's write lock at BEGIN, so
+        # concurrent checkouts queue for it (up to ``timeout`` seconds) instead of
+        # failing with "database is locked" when a read lock cannot be upgraded.
+        # Reads outside atomic blocks do not take it.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # Tests use a file (ignored by git) rather than the default in-memory
+        # database, whose connections all share one cache, so the threaded
+        # checkout tests wait for locks the way production connections do
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# 🧠 CACHE
+# Shared by every gunicorn worker, so response, detail-page and count cache invalidations and
+# warm_caches reach all of them. Set REDIS_URL (needs the redis package) on multi-host deployments.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
 # 🔑 PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -89,7 +117,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ⚙️ REST FRAMEWORK
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
-    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_RENDERER_CLASSES': ['batteries.renderers.FastJSONRenderer'],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
@@ -99,6 +127,34 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 12,
 }
 
+# 🔋 CATALOG PERFORMANCE
+# Serialize battery/brand/category list pages from .values() rows (see batteries/fast_serializers.py)
+BATTERIES_FAST_SERIALIZATION = True
+# Seconds a worker may reuse catalog version counters before re-reading them
+CATALOG_VERSION_TTL = 1.0
+# Minimum trigram similarity for ?fuzzy= matches and suggestion top-ups
+BATTERY_FUZZY_THRESHOLD = 0.3
+# Answer range-filtered battery lists from an in-memory columnar snapshot (see batteries/snapshot.py)
+BATTERY_SNAPSHOT_ENABLED = False
+# Number of equivalent batteries stored per battery (see batteries/equivalents.py)
+BATTERY_EQUIVALENTS_COUNT = 5
+# Cache anonymous catalog responses, invalidated by tag on writes (see batteries/caching.py)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_TIMEOUT = 300
+# Seconds a stale entry may still be served while one background thread re-renders it;
+# views override this with cache_stale_timeout. Concurrent misses wait up to the lock timeout.
+RESPONSE_CACHE_STALE_TIMEOUT = 0
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RESPONSE_CACHE_REFRESH_THREADS = 2
+# Read dashboard_stats from a signal-maintained row instead of counting (check with check_dashboard_stats)
+DASHBOARD_STATS_MATERIALIZED = False
+# Serve battery detail pages from a per-slug cache re-rendered after writes (see batteries/detail_cache.py)
+BATTERY_DETAIL_CACHE_ENABLED = True
+BATTERY_DETAIL_CACHE_TIMEOUT = 3600
+# Pages rendered by warm_caches and the gunicorn post-fork hook (see gunicorn.conf.py)
+CACHE_WARMUP_BASE_URL = os.environ.get('CACHE_WARMUP_BASE_URL', 'http://localhost:8000')
+CACHE_WARMUP_DETAILS = 50
+
 # 🌍 CORS CONFIGURATION
 CORS_ALLOWED_ORIGINS = [
     "https://exactmatch.co.ke",
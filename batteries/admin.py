@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from . import versioning
 from .models import (
     Battery, BatteryImage, Brand, Category,
     Review, Order, OrderItem, Wishlist
@@ -69,8 +70,16 @@ class BatteryAdmin(admin.ModelAdmin):
         }),
     )
     
+    actions = ['refresh_review_stats']
+    
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('brand')
+    
+    @admin.action(description='Recalculate review statistics')
+    def refresh_review_stats(self, request, queryset):
+        updated = queryset.refresh_review_stats()
+        versioning.bump('review')
+        self.message_user(request, f'Recalculated review statistics for {updated} batteries.')
 
 @admin.register(BatteryImage)
 class BatteryImageAdmin(admin.ModelAdmin):
@@ -0,0 +1,403 @@
+"""HTTP caching for catalog reads: a tag-based response cache and ETags.
+
+A cached entry holds the rendered response together with the version of every
+tag it depends on ("batteries", "brands", "reviews", ...). Tag versions
+live in the same Django cache; invalidating a tag gives it a new random
+version, so every entry recorded against the old one is ignored on its next
+read. Signals in ``batteries.signals`` invalidate tags on writes.
+Any Django cache backend works; with several processes it must be shared, as
+the ``CACHES`` setting configures, for invalidations to reach every worker.
+
+An entry is fresh for the endpoint's ``cache_timeout`` and until one of its
+tags moves. Endpoints with a ``cache_stale_timeout`` keep serving a stale
+entry for that long while a background thread re-renders it. Otherwise
+recomputing is single-flight: one request per key takes a short lock
+(``cache.add``) and the others wait for its result, so an expired popular
+page is computed once rather than by every concurrent request. The
+file-based backend's ``add`` is not atomic across processes, so there two
+workers may occasionally both recompute a page.
+
+ETags are derived from the catalog version counters a view declares in
+``etag_version_keys`` plus the URL, ``Accept`` header and caller identity, so
+a matching ``If-None-Match`` is answered with 304 after one small query and
+before any queryset runs or anything is rendered. A cached entry keeps the
+ETag of the request that rendered it: a stale body, or one stored before a
+write another worker has not yet invalidated, goes out under the ETag of the
+versions it was built from, never under the current one.
+"""
+import functools
+import hashlib
+import io
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.db import connections, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from . import versioning
+
+TAG_PREFIX = 'response-tag:'
+ENTRY_PREFIX = 'response:'
+# Headers that differ between otherwise identical requests for the same URL
+KEY_HEADERS = ('HTTP_ACCEPT',)
+STORED_HEADERS = ('Content-Type', 'Vary', 'Allow')
+LOCK_SUFFIX = ':lock'
+WAIT_INTERVAL = 0.05
+# Set on requests re-rendering a stale entry, whose lock is already held
+REFRESH_META_KEY = 'batteries.caching.refresh'
+# Set by conditional_dispatch to the ETag of the versions read before the body is computed
+ETAG_META_KEY = 'batteries.caching.etag'
+
+logger = logging.getLogger(__name__)
+# Key -> event set when this process's computation of it finishes
+_in_flight = {}
+_executor_lock = threading.Lock()
+_executor = None
+_handler_lock = threading.Lock()
+_handler = None
+
+
+def cache_enabled():
+    return getattr(settings, 'RESPONSE_CACHE_ENABLED', False)
+
+
+def default_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def default_stale_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_STALE_TIMEOUT', 0)
+
+
+def lock_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_LOCK_TIMEOUT', 10)
+
+
+def cacheable_request(request):
+    """Anonymous GET requests; authenticated ones may carry a session or credentials"""
+    return (
+        cache_enabled()
+        and request.method == 'GET'
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def response_cache_key(request):
+    parts = [
+        request.scheme,
+        request.get_host(),
+        request.path,
+        sorted(request.GET.lists()),
+        [request.META.get(header, '') for header in KEY_HEADERS],
+    ]
+    return ENTRY_PREFIX + hashlib.md5(json.dumps(parts).encode()).hexdigest()
+
+
+def tag_versions(tags):
+    """Current version of each tag, assigning one to tags seen for the first time"""
+    keys = {tag: TAG_PREFIX + tag for tag in tags}
+    found = cache.get_many(keys.values())
+    missing = {key: uuid.uuid4().hex for key in keys.values() if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {tag: found[key] for tag, key in keys.items()}
+
+
+def invalidate_tags(*tags):
+    """Give ``tags`` new versions now and again once the surrounding transaction commits.
+
+    The second pass stops a concurrent read that still saw the old rows from
+    caching them under a version that is already current.
+    """
+    if not tags:
+        return
+    cache.set_many({TAG_PREFIX + tag: uuid.uuid4().hex for tag in tags}, None)
+    transaction.on_commit(lambda: cache.set_many({TAG_PREFIX + tag: uuid.uuid4().hex for tag in tags}, None))
+
+
+def lookup(key):
+    """``(entry, fresh)`` for ``key``; ``entry`` is None on a miss"""
+    entry = cache.get(key)
+    if entry is None:
+        return None, False
+    return entry, time.time() < entry.get('fresh_until', 0) and tag_versions(entry['tags']) == entry['tags']
+
+
+def build_response(entry):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    if entry.get('etag'):
+        response['ETag'] = entry['etag']
+    return response
+
+
+def acquire(key):
+    """Claim the recomputation of ``key`` across processes; False if someone else holds it"""
+    if not cache.add(key + LOCK_SUFFIX, True, lock_timeout()):
+        return False
+    _in_flight[key] = threading.Event()
+    return True
+
+
+def release(key):
+    cache.delete(key + LOCK_SUFFIX)
+    event = _in_flight.pop(key, None)
+    if event is not None:
+        event.set()
+
+
+def wait_for_entry(key):
+    """The fresh entry the lock holder stores for ``key``, or None if it gives up or takes too long"""
+    deadline = time.monotonic() + lock_timeout()
+    event = _in_flight.get(key)
+    if event is not None:
+        event.wait(lock_timeout())
+    while True:
+        entry, fresh = lookup(key)
+        if fresh:
+            return entry
+        if time.monotonic() >= deadline or cache.get(key + LOCK_SUFFIX) is None:
+            return None
+        time.sleep(WAIT_INTERVAL)
+
+
+def refresh_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RESPONSE_CACHE_REFRESH_THREADS', 2),
+                thread_name_prefix='response-cache-refresh',
+            )
+        return _executor
+
+
+def internal_get(base_url, path, query_string='', **meta):
+    """Response to an anonymous GET of ``path`` on ``base_url``, handled like a client's.
+
+    The request goes through the middleware and the view of the running
+    project; ``meta`` adds ``request.META`` entries such as the refresh
+    markers. The caller closes database connections on worker threads.
+    """
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            _handler = WSGIHandler()
+    scheme, host = base_url.split('://', 1)
+    request = WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'HTTP_HOST': host,
+        'SERVER_NAME': host.rsplit(':', 1)[0],
+        'SERVER_PORT': '443' if scheme == 'https' else '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': scheme,
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        **meta,
+    })
+    return _handler.get_response(request)
+
+
+def refresh_in_background(key, request):
+    """Re-render ``request`` on a worker thread; the caller holds the lock of ``key``"""
+    base_url = f'{request.scheme}://{request.get_host()}'
+    path, query = request.path_info, request.META.get('QUERY_STRING', '')
+    meta = {header: request.META[header] for header in KEY_HEADERS if header in request.META}
+    meta[REFRESH_META_KEY] = True
+
+    def refresh():
+        try:
+            internal_get(base_url, path, query, **meta)
+        except Exception:
+            logger.exception('Background refresh of %s failed', path)
+        finally:
+            release(key)
+            connections.close_all()
+
+    refresh_executor().submit(refresh)
+
+
+def store_response(key, response, versions, late_tags=(), timeout=None, stale_timeout=0, locked=False, etag=None):
+    """Cache ``response`` once rendered, if it succeeded, then release the lock of ``key`` if ``locked``.
+
+    ``versions`` were read before the response was computed; ``late_tags`` are
+    only known afterwards (for example the brand of a fetched battery). The
+    entry is fresh for ``timeout`` seconds and kept ``stale_timeout`` longer.
+    ``etag`` is sent with every later copy of the entry.
+    """
+    timeout = default_timeout() if timeout is None else timeout
+    if response.status_code != 200 or response.has_header('Set-Cookie'):
+        if locked:
+            release(key)
+        return response
+
+    def store(rendered):
+        try:
+            tags = {**tag_versions(late_tags), **versions}
+            cache.set(key, {
+                'tags': tags,
+                'fresh_until': time.time() + timeout,
+                'content': rendered.content,
+                'status': rendered.status_code,
+                'headers': {header: rendered[header] for header in STORED_HEADERS if rendered.has_header(header)},
+                'etag': etag,
+            }, timeout + stale_timeout)
+        finally:
+            if locked:
+                release(key)
+
+    if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+def cached_dispatch(request, tags, compute, late_tags=lambda: (), timeout=None, stale_timeout=None):
+    if not cacheable_request(request):
+        return compute()
+    key = response_cache_key(request)
+    stale_timeout = default_stale_timeout() if stale_timeout is None else stale_timeout
+    # A background refresh runs under the lock taken by the request that scheduled it
+    locked = bool(request.META.get(REFRESH_META_KEY))
+    if not locked:
+        entry, fresh = lookup(key)
+        if fresh:
+            return build_response(entry)
+        if entry is not None and stale_timeout:
+            if acquire(key):
+                refresh_in_background(key, request)
+            return build_response(entry)
+        locked = acquire(key)
+        if not locked:
+            entry = wait_for_entry(key)
+            if entry is not None:
+                return build_response(entry)
+    versions = tag_versions(tags)
+    try:
+        response = compute()
+    except Exception:
+        if locked:
+            release(key)
+        raise
+    return store_response(key, response, versions, late_tags(), timeout, stale_timeout, locked, request.META.get(ETAG_META_KEY))
+
+
+def cache_response(*tags, timeout=None, stale_timeout=None):
+    """Cache a function view's anonymous responses under ``tags``; apply above ``@api_view``"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return cached_dispatch(request, tags, lambda: view(request, *args, **kwargs), timeout=timeout, stale_timeout=stale_timeout)
+        return wrapped
+    return decorator
+
+
+class CachedResponseMixin:
+    """Caches a class-based view's anonymous responses under ``get_cache_tags()``.
+
+    Tags only known once the response is computed can be appended to
+    ``self.late_cache_tags``. ``cache_timeout`` and ``cache_stale_timeout``
+    default to the RESPONSE_CACHE_* settings.
+    """
+    cache_tags = ()
+    cache_timeout = None
+    cache_stale_timeout = None
+
+    def get_cache_tags(self):
+        return self.cache_tags
+
+    def dispatch(self, request, *args, **kwargs):
+        self.args, self.kwargs = args, kwargs
+        self.late_cache_tags = []
+        return cached_dispatch(
+            request,
+            self.get_cache_tags(),
+            lambda: super(CachedResponseMixin, self).dispatch(request, *args, **kwargs),
+            lambda: self.late_cache_tags,
+            self.cache_timeout,
+            self.cache_stale_timeout,
+        )
+
+
+def request_identity(request):
+    """Who is asking, without running DRF authentication: session user, credentials digest or anonymous"""
+    if 'HTTP_AUTHORIZATION' in request.META:
+        return 'credentials:' + hashlib.sha256(request.META['HTTP_AUTHORIZATION'].encode()).hexdigest()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return 'anonymous'
+
+
+def catalog_etag(request, version_keys):
+    """Strong ETag for this URL as the caller sees it at the current catalog versions"""
+    parts = [
+        versioning.get_versions(version_keys, max_age=0) if version_keys else {},
+        request.path,
+        sorted(request.GET.lists()),
+        request.META.get('HTTP_ACCEPT', ''),
+        request_identity(request),
+    ]
+    return '"%s"' % hashlib.md5(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def conditional_dispatch(request, version_keys, compute):
+    if request.method not in ('GET', 'HEAD'):
+        return compute()
+    etag = catalog_etag(request, version_keys)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return not_modified(etag)
+    request.META[ETAG_META_KEY] = etag
+    response = compute()
+    if response.status_code == 200:
+        # A cached body already carries the ETag it was rendered under
+        etag = response.get('ETag', etag)
+        if etag in if_none_match:
+            return not_modified(etag)
+        response['ETag'] = etag
+    return response
+
+
+def conditional_get(*version_keys):
+    """Answer ``If-None-Match`` for a function view; apply above ``@cache_response``/``@api_view``"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return conditional_dispatch(request, version_keys, lambda: view(request, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+class ConditionalGetMixin:
+    """ETag/If-None-Match support from ``etag_version_keys``; list it before CachedResponseMixin"""
+    etag_version_keys = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        return conditional_dispatch(
+            request,
+            self.etag_version_keys,
+            lambda: super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs),
+        )
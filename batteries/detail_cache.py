@@ -0,0 +1,98 @@
+"""Write-through cache of rendered battery detail pages, keyed by slug.
+
+``BatteryDetailView`` stores the rendered JSON of each page it serves, once
+per base URL since image links are absolute, and answers later requests with
+those bytes directly, under the ETag they were rendered with. All pages of a
+slug share one cache entry, recorded against the version of the slug's tag
+(see ``batteries.caching``). Writes to a battery, its images, reviews, brand
+or categories invalidate that tag now and again at commit, so no worker
+serves the old page, not even one a concurrent read stored in between. After
+the commit the pages that were cached are re-rendered on a background thread
+by internal requests through the middleware and the view, so hot pages are
+warm again without holding up the writer.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.urls import reverse
+
+from .caching import internal_get, invalidate_tags, refresh_executor, tag_versions
+
+# Set on internal requests that must re-render instead of reading the cache
+REFRESH_META_KEY = 'batteries.detail_cache.refresh'
+
+logger = logging.getLogger(__name__)
+
+
+def detail_cache_enabled():
+    return getattr(settings, 'BATTERY_DETAIL_CACHE_ENABLED', False)
+
+
+def base_url(request):
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def cache_key(slug):
+    return f'battery-detail:{slug}'
+
+
+def cache_tag(slug):
+    return f'battery-detail:{slug}'
+
+
+def cacheable(request):
+    # ?expand= changes the payload; every other query parameter is ignored by the view
+    return detail_cache_enabled() and request.method == 'GET' and 'expand' not in request.GET
+
+
+def version(slug):
+    """Version of the slug's tag; read it before rendering and pass it to ``store``"""
+    return tag_versions([cache_tag(slug)])[cache_tag(slug)]
+
+
+def get(slug, request):
+    """``(content, etag)`` of the cached page, or None"""
+    if request.META.get(REFRESH_META_KEY):
+        return None
+    entry = cache.get(cache_key(slug))
+    if entry is None or entry['version'] != version(slug):
+        return None
+    return entry['pages'].get(base_url(request))
+
+
+def store(slug, request, page_version, content, etag=None):
+    entry = cache.get(cache_key(slug))
+    pages = entry['pages'] if entry is not None and entry['version'] == page_version else {}
+    cache.set(
+        cache_key(slug),
+        {'version': page_version, 'pages': {**pages, base_url(request): (content, etag)}},
+        getattr(settings, 'BATTERY_DETAIL_CACHE_TIMEOUT', 3600),
+    )
+
+
+def refresh(slugs):
+    """Invalidate the cached pages of ``slugs`` and re-render the ones that were cached after commit"""
+    if not detail_cache_enabled():
+        return
+    slugs = set(slugs)
+    if not slugs:
+        return
+    keys = {cache_key(slug): slug for slug in slugs}
+    entries = cache.get_many(keys)
+    invalidate_tags(*(cache_tag(slug) for slug in slugs))
+    hot = [(keys[key], base) for key, entry in entries.items() for base in entry['pages']]
+    if hot:
+        transaction.on_commit(lambda: refresh_executor().submit(rerender, hot))
+
+
+def rerender(pages):
+    try:
+        for slug, base in pages:
+            # Stores the fresh payload as a side effect; a battery gone inactive just 404s
+            internal_get(base, reverse('battery-detail', kwargs={'slug': slug}), **{REFRESH_META_KEY: True})
+    except Exception:
+        logger.exception('Re-rendering battery detail pages failed')
+    finally:
+        connections.close_all()
@@ -0,0 +1,44 @@
+"""Physical-fit search: which batteries fit a tray of given dimensions.
+
+Active batteries are indexed in a k-d tree over (length, width, height,
+amp_hours, cold_cranking_amps), each carrying its voltage for the voltage
+filter. A query becomes one box search: each
+dimension may exceed the tray by at most ``tolerance`` and fall short by at
+most ``max_gap`` cm, and the electrical specs have lower bounds only. Matches
+are ranked by how snugly they fit, i.e. the euclidean distance between the
+tray and battery dimensions. The tree is rebuilt when the battery catalog
+version moves.
+"""
+import math
+
+from .kdtree import KDTree
+from .models import Battery
+from .versioning import VersionedIndex
+
+FIT_FIELDS = ('length', 'width', 'height', 'amp_hours', 'cold_cranking_amps')
+
+
+class FitIndex(VersionedIndex):
+    version_keys = ('battery',)
+
+    def build(self):
+        rows = Battery.objects.filter(is_active=True).order_by().values_list('pk', 'voltage', *FIT_FIELDS)
+        return KDTree([tuple(float(value) for value in row[2:]) for row in rows], [row[:2] for row in rows])
+
+    def search(self, length, width, height, tolerance, max_gap, min_amp_hours=None, min_cca=None, voltage=None, limit=None):
+        """Ids of batteries fitting the tray, snuggest first; all of them unless ``limit`` is given"""
+        tray = (float(length), float(width), float(height))
+        tolerance, max_gap = float(tolerance), float(max_gap)
+        low = (*(size - max_gap for size in tray), min_amp_hours or -math.inf, min_cca or -math.inf)
+        high = (*(size + tolerance for size in tray), math.inf, math.inf)
+        tree = self.current()
+        matches = tree.range_search(low, high) if len(tree) else []
+        matches = [
+            (point, battery_id) for point, (battery_id, battery_voltage) in matches
+            if voltage is None or battery_voltage == voltage
+        ]
+        matches.sort(key=lambda match: (math.dist(match[0][:3], tray), match[1].hex))
+        return [battery_id for _, battery_id in matches[:limit]]
+
+
+fit_index = FitIndex()
@@ -0,0 +1,145 @@
+"""Spec-similarity "equivalent battery" recommendations.
+
+Every active battery is described by its amp hours, cold cranking amps,
+reserve capacity and dimensions, z-scored over the active catalog so each spec
+weighs the same. Its equivalents are the nearest batteries of the same voltage
+by euclidean distance between those vectors, stored as ``BatteryEquivalent``
+rows. ``compute_equivalents`` recomputes the whole catalog in batch, using
+NumPy for the distance matrices when installed and k-d trees otherwise.
+``refresh_battery`` recomputes only the batteries a single write can affect;
+signals run it once the write commits. Incremental refreshes reuse the
+current catalog statistics, so distances of untouched batteries drift
+slightly until the next batch run.
+"""
+import math
+import statistics
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from . import versioning
+from .kdtree import KDTree
+from .models import Battery, BatteryEquivalent
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SPEC_FIELDS = ('amp_hours', 'cold_cranking_amps', 'reserve_capacity', 'length', 'width', 'height')
+SOURCE_FIELDS = {*SPEC_FIELDS, 'voltage', 'is_active'}
+BLOCK_SIZE = 512
+
+
+def equivalents_count():
+    return getattr(settings, 'BATTERY_EQUIVALENTS_COUNT', 5)
+
+
+def load_vectors():
+    """Normalized spec vectors of active batteries as {voltage: {battery id: vector}}"""
+    rows = list(Battery.objects.filter(is_active=True).order_by().values_list('pk', 'voltage', *SPEC_FIELDS))
+    columns = [[float(value) for value in column] for column in zip(*(row[2:] for row in rows))]
+    scales = [(statistics.fmean(column), statistics.pstdev(column) or 1.0) for column in columns]
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[1], {})[row[0]] = tuple(
+            (float(value) - mean) / deviation for value, (mean, deviation) in zip(row[2:], scales)
+        )
+    return groups
+
+
+def nearest_neighbours(vectors, targets, k):
+    """{target id: [(distance, neighbour id), ...]} nearest first, over one voltage group"""
+    ids = list(vectors)
+    if numpy is not None:
+        matrix = numpy.array([vectors[pk] for pk in ids], dtype=float)
+        norms = (matrix ** 2).sum(axis=1)
+        positions = {pk: position for position, pk in enumerate(ids)}
+        target_positions = numpy.array([positions[pk] for pk in targets], dtype=int)
+        neighbours = {}
+        for start in range(0, len(target_positions), BLOCK_SIZE):
+            block = target_positions[start:start + BLOCK_SIZE]
+            distances = norms[block, None] + norms[None, :] - 2 * matrix[block] @ matrix.T
+            distances[numpy.arange(len(block)), block] = numpy.inf
+            count = min(k, len(ids) - 1)
+            if count <= 0:
+                neighbours.update((ids[position], []) for position in block)
+                continue
+            nearest = numpy.argpartition(distances, count - 1, axis=1)[:, :count]
+            for row, position in enumerate(block):
+                found = sorted((max(distances[row, column], 0.0), ids[column]) for column in nearest[row])
+                neighbours[ids[position]] = [(math.sqrt(distance), pk) for distance, pk in found]
+        return neighbours
+    tree = KDTree([vectors[pk] for pk in ids], ids)
+    return {
+        pk: [(math.sqrt(distance), neighbour) for distance, neighbour in tree.nearest(vectors[pk], k, exclude=pk)]
+        for pk in targets
+    }
+
+
+def store(neighbours, replaced):
+    """Swap the ``replaced`` rows for ``neighbours`` in one transaction and invalidate cached lists"""
+    with transaction.atomic():
+        replaced.delete()
+        BatteryEquivalent.objects.bulk_create(
+            BatteryEquivalent(battery_id=battery_id, equivalent_id=equivalent_id, rank=rank, distance=distance)
+            for battery_id, found in neighbours.items()
+            for rank, (distance, equivalent_id) in enumerate(found, start=1)
+        )
+        versioning.bump('equivalents')
+
+
+def compute_equivalents():
+    """Recompute equivalents for the whole catalog and return the number of stored pairs"""
+    k = equivalents_count()
+    neighbours = {}
+    for vectors in load_vectors().values():
+        neighbours.update(nearest_neighbours(vectors, list(vectors), k))
+    store(neighbours, BatteryEquivalent.objects.all())
+    return sum(len(found) for found in neighbours.values())
+
+
+def refresh_battery(battery_id, previous_neighbours=()):
+    """Recompute the equivalents a change to ``battery_id`` can affect.
+
+    That is the battery itself, every battery that listed it (plus
+    ``previous_neighbours`` captured before a delete cascaded them away) and
+    every battery it is now closer to than that battery's current k-th
+    equivalent.
+    """
+    k = equivalents_count()
+    groups = load_vectors()
+    affected = {battery_id, *previous_neighbours}
+    affected.update(BatteryEquivalent.objects.filter(equivalent_id=battery_id).values_list('battery_id', flat=True))
+
+    vectors = next((group for group in groups.values() if battery_id in group), {})
+    if battery_id in vectors:
+        stored = {
+            row['battery_id']: row
+            for row in BatteryEquivalent.objects.values('battery_id').annotate(
+                farthest=Max('distance'), count=Count('pk')
+            )
+        }
+        target = vectors[battery_id]
+        for pk, vector in vectors.items():
+            row = stored.get(pk)
+            if row is None or row['count'] < k or math.dist(vector, target) < row['farthest']:
+                affected.add(pk)
+
+    neighbours = {pk: [] for pk in affected}
+    for group in groups.values():
+        targets = [pk for pk in affected if pk in group]
+        if targets:
+            neighbours.update(nearest_neighbours(group, targets, k))
+    store(neighbours, BatteryEquivalent.objects.filter(battery_id__in=affected))
+
+
+def equivalent_ids(battery_id):
+    """Ordered equivalent ids of one battery, cached per battery until equivalents change"""
+    version = versioning.get_versions(['equivalents'])['equivalents']
+    return cache.get_or_set(
+        f'battery-equivalents:{battery_id}:{version}',
+        lambda: list(BatteryEquivalent.objects.filter(battery_id=battery_id).order_by('rank').values_list('equivalent_id', flat=True)),
+    )
@@ -0,0 +1,232 @@
+"""Read-only list serialization from ``.values()`` rows.
+
+These serializers produce exactly the same data as their DRF counterparts in
+``serializers.py`` but skip model instantiation and per-field
+``to_representation`` dispatch. Each output key is compiled once into an
+extractor that reads a column from the row and applies the column's encoder,
+so rendering a page is a tight loop over plain dicts.
+"""
+import abc
+import decimal
+from operator import itemgetter
+
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Battery, BatteryImage, Brand, Category
+from .serializers import brand_battery_counts
+
+
+def decimal_encoder(model, field_name):
+    field = model._meta.get_field(field_name)
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+
+    def encode(value):
+        if value is None:
+            return None
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f'{value.quantize(exponent, context=context):f}'
+    return encode
+
+
+def uuid_encoder():
+    def encode(value):
+        return None if value is None else str(value)
+    return encode
+
+
+def datetime_encoder():
+    field_timezone = timezone.get_current_timezone()
+
+    def encode(value):
+        if not value:
+            return None
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return encode
+
+
+def file_url_encoder(model, field_name, request):
+    storage = model._meta.get_field(field_name).storage
+
+    def encode(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return encode
+
+
+def column(name, encode=None):
+    get = itemgetter(name)
+    if encode is None:
+        return get
+    return lambda row: encode(get(row))
+
+
+class RowSerializer(abc.ABC):
+    """Serializes ``.values()`` rows through extractors compiled once per instance"""
+    columns = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.request = self.context.get('request')
+        self.extractors = tuple(self.get_extractors().items())
+
+    @abc.abstractmethod
+    def get_extractors(self):
+        """{output key: callable(row)}, in output order"""
+
+    def prepare(self, rows):
+        """Hook for bulk-loading related data for the whole page"""
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        extractors = self.extractors
+        return [{key: extract(row) for key, extract in extractors} for row in rows]
+
+
+class BrandRowSerializer(RowSerializer):
+    """Mirrors BrandSerializer"""
+    columns = ('id', 'name', 'logo', 'description', 'website', 'country', 'is_popular')
+
+    def prepare(self, rows):
+        self.battery_counts = self.context.get('brand_battery_counts')
+        if self.battery_counts is None:
+            self.battery_counts = brand_battery_counts()
+
+    def get_extractors(self):
+        return {
+            'id': column('id'),
+            'name': column('name'),
+            'logo': column('logo', file_url_encoder(Brand, 'logo', self.request)),
+            'description': column('description'),
+            'website': column('website'),
+            'country': column('country'),
+            'is_popular': column('is_popular'),
+            'battery_count': lambda row: self.battery_counts.get(row['id'], 0),
+        }
+
+
+class CategoryRowSerializer(RowSerializer):
+    """Mirrors CategorySerializer, resolving subcategories from ``category_children``.
+
+    ``category_children`` maps a parent id to its active child rows in display
+    order and ``category_battery_counts`` maps a category id to its active
+    battery count, as built by :func:`category_row_context`.
+    """
+    columns = (
+        'id', 'name', 'description', 'category_type', 'parent_category_id',
+        'image', 'is_active', 'display_order',
+    )
+
+    def get_extractors(self):
+        children = self.context['category_children']
+        counts = self.context['category_battery_counts']
+        return {
+            'id': column('id'),
+            'name': column('name'),
+            'description': column('description'),
+            'category_type': column('category_type'),
+            'parent_category': column('parent_category_id'),
+            'image': column('image', file_url_encoder(Category, 'image', self.request)),
+            'is_active': column('is_active'),
+            'display_order': column('display_order'),
+            'battery_count': lambda row: counts.get(row['id'], 0),
+            'subcategories': lambda row: self.serialize(children.get(row['id'], ())),
+        }
+
+
+def category_row_context(rows):
+    """Row-based counterpart of ``serializers.category_tree_context``"""
+    children = {}
+    for row in rows:
+        children.setdefault(row['parent_category_id'], []).append(row)
+    counts = dict(
+        Battery.categories.through.objects.filter(battery__is_active=True)
+        .order_by().values('category_id').annotate(count=Count('battery_id'))
+        .values_list('category_id', 'count')
+    )
+    return {'category_children': children, 'category_battery_counts': counts}
+
+
+class BatteryRowSerializer(RowSerializer):
+    """Mirrors BatteryListSerializer with the compact brand and category embeds"""
+    columns = (
+        'id', 'name', 'brand_id', 'brand__name', 'model_number', 'voltage',
+        'amp_hours', 'cold_cranking_amps', 'condition', 'price', 'original_price',
+        'short_description', 'is_featured', 'is_popular', 'stock_quantity', 'slug',
+        'average_rating', 'review_count', 'created_at',
+    )
+
+    def prepare(self, rows):
+        ids = [row['id'] for row in rows]
+        self.categories = {}
+        links = Battery.categories.through.objects.filter(battery_id__in=ids).order_by(
+            'category__category_type', 'category__display_order', 'category__name'
+        ).values_list('battery_id', 'category_id', 'category__name', 'category__category_type')
+        for battery_id, category_id, name, category_type in links:
+            self.categories.setdefault(battery_id, []).append(
+                {'id': category_id, 'name': name, 'category_type': category_type}
+            )
+        self.images = {}
+        images = BatteryImage.objects.filter(battery_id__in=ids).order_by(
+            'battery_id', '-is_primary', 'order', 'created_at'
+        ).values_list('battery_id', 'image')
+        for battery_id, image in images:
+            self.images.setdefault(battery_id, image)
+
+    def get_extractors(self):
+        encode_price = decimal_encoder(Battery, 'price')
+        encode_original_price = decimal_encoder(Battery, 'original_price')
+        encode_image = file_url_encoder(BatteryImage, 'image', self.request)
+        request = self.request
+
+        def brand(row):
+            name = row['brand__name']
+            return {'id': row['brand_id'], 'name': name, 'slug': name.lower().replace(' ', '-')}
+
+        def discount_percentage(row):
+            price, original_price = row['price'], row['original_price']
+            if original_price and original_price > price:
+                return round(((original_price - price) / original_price) * 100)
+            return 0
+
+        def primary_image(row):
+            image = self.images.get(row['id'])
+            # BatteryListSerializer only exposes images when it can build an absolute URL
+            return encode_image(image) if image and request is not None else None
+
+        def average_rating(row):
+            return round(row['average_rating'], 1) if row['review_count'] else 0
+
+        return {
+            'id': column('id', uuid_encoder()),
+            'name': column('name'),
+            'brand': brand,
+            'categories': lambda row: self.categories.get(row['id'], []),
+            'model_number': column('model_number'),
+            'voltage': column('voltage'),
+            'amp_hours': column('amp_hours'),
+            'cold_cranking_amps': column('cold_cranking_amps'),
+            'condition': column('condition'),
+            'price': column('price', encode_price),
+            'original_price': column('original_price', encode_original_price),
+            'short_description': column('short_description'),
+            'is_featured': column('is_featured'),
+            'is_popular': column('is_popular'),
+            'is_in_stock': lambda row: row['stock_quantity'] > 0,
+            'stock_quantity': column('stock_quantity'),
+            'discount_percentage': discount_percentage,
+            'slug': column('slug'),
+            'primary_image': primary_image,
+            'average_rating': average_rating,
+            'review_count': column('review_count'),
+            'created_at': column('created_at', datetime_encoder()),
+        }
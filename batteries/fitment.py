@@ -0,0 +1,141 @@
+"""Vehicle fitment parsing and lookups.
+
+A battery's ``compatible_vehicles``, ``vehicle_makes`` and ``vehicle_models``
+lists are free-form JSON. They are parsed into ``VehicleFitment`` rows with
+lower-cased ``make_key``/``model_key`` columns so searches become indexed
+equality and word-prefix lookups instead of ``icontains`` scans over JSON text.
+"""
+import re
+
+from django.db.models import Q
+
+YEAR_RANGE_RE = re.compile(r'\b((?:19|20)\d{2})(?:\s*(?:-|to)\s*((?:19|20)\d{2}|present|on|\+))?\b', re.IGNORECASE)
+ENGINE_RE = re.compile(r'\b(\d\.\d\s?[lL]?(?:\s?(?:TDI|VVT-?i|D-4D|[A-Z]{1,4}\d?))?)\b')
+YEAR_TOKEN_RE = re.compile(r'^(?:19|20)\d{2}$')
+
+
+def normalize(value):
+    return ' '.join(str(value).lower().split())
+
+
+def parse_years(text):
+    match = YEAR_RANGE_RE.search(text)
+    if not match:
+        return text, None, None
+    year_from = int(match.group(1))
+    end = match.group(2)
+    if end is None:
+        year_to = year_from
+    elif end.isdigit():
+        year_to = int(end)
+    else:
+        year_to = None
+    return text[:match.start()] + text[match.end():], year_from, year_to
+
+
+def parse_vehicle(entry, known_makes):
+    """Parse a ``compatible_vehicles`` entry such as ``"Toyota Hilux 2.5 D-4D 2005-2015"``"""
+    if isinstance(entry, dict):
+        return {
+            'make': str(entry.get('make', '')).strip(),
+            'model': str(entry.get('model', '')).strip(),
+            'year_from': entry.get('year_from'),
+            'year_to': entry.get('year_to'),
+            'engine': str(entry.get('engine', '')).strip(),
+        }
+
+    text, year_from, year_to = parse_years(str(entry))
+    engine = ''
+    match = ENGINE_RE.search(text)
+    if match:
+        engine = match.group(1).strip()
+        text = text[:match.start()] + text[match.end():]
+    words = text.split()
+
+    make = ''
+    lowered = normalize(text)
+    for known in sorted(known_makes, key=len, reverse=True):
+        key = normalize(known)
+        if key and (lowered == key or lowered.startswith(key + ' ')):
+            make = ' '.join(words[:len(key.split())])
+            words = words[len(key.split()):]
+            break
+    else:
+        if len(words) > 1:
+            make, words = words[0], words[1:]
+
+    return {
+        'make': make,
+        'model': ' '.join(words),
+        'year_from': year_from,
+        'year_to': year_to,
+        'engine': engine,
+    }
+
+
+def parse_fitments(compatible_vehicles, vehicle_makes, vehicle_models):
+    """Turn a battery's compatibility lists into fitment row dicts, without duplicates"""
+    makes = [str(make).strip() for make in vehicle_makes or [] if str(make).strip()]
+    rows = [parse_vehicle(entry, makes) for entry in compatible_vehicles or [] if entry]
+    rows = [row for row in rows if row['make'] or row['model']]
+
+    covered_makes = {normalize(row['make']) for row in rows}
+    covered_models = {normalize(row['model']) for row in rows}
+    rows += [
+        {'make': make, 'model': '', 'year_from': None, 'year_to': None, 'engine': ''}
+        for make in makes if normalize(make) not in covered_makes
+    ]
+    rows += [
+        {'make': '', 'model': str(model).strip(), 'year_from': None, 'year_to': None, 'engine': ''}
+        for model in vehicle_models or [] if str(model).strip() and normalize(model) not in covered_models
+    ]
+
+    unique = {}
+    for row in rows:
+        row['make_key'] = normalize(row['make'])
+        row['model_key'] = normalize(row['model'])
+        key = (row['make_key'], row['model_key'], row['year_from'], row['year_to'], row['engine'].lower())
+        unique.setdefault(key, row)
+    return list(unique.values())
+
+
+def model_q(model_key):
+    """Whole-word prefix match: "land cruiser" finds "land cruiser prado" but "fit" never finds "outfitter"."""
+    return Q(model_key=model_key) | Q(model_key__gte=model_key + ' ', model_key__lt=model_key + '!')
+
+
+def year_q(year):
+    return (Q(year_from__isnull=True) | Q(year_from__lte=year)) & (Q(year_to__isnull=True) | Q(year_to__gte=year))
+
+
+def dated_year_q(year):
+    """A year on its own only matches fitments with known years; undated rows would match every year."""
+    return Q(year_from__isnull=False) & year_q(year)
+
+
+def vehicle_text_q(value):
+    """Fitment condition for free text such as "Toyota Vitz", "Vitz 2010" or "Ashok Leyland"."""
+    words = normalize(value).split()
+    years = [int(word) for word in words if YEAR_TOKEN_RE.match(word)]
+    words = [word for word in words if not YEAR_TOKEN_RE.match(word)]
+    if not words:
+        return dated_year_q(years[0]) if years else Q(pk__in=[])
+
+    text = ' '.join(words)
+    condition = Q(make_key=text) | model_q(text)
+    for split in range(1, len(words)):
+        condition |= Q(make_key=' '.join(words[:split])) & model_q(' '.join(words[split:]))
+    if years:
+        condition &= year_q(years[0])
+    return condition
+
+
+def vehicle_q(make=None, model=None, year=None):
+    condition = Q()
+    if make:
+        condition &= Q(make_key=normalize(make))
+    if model:
+        condition &= model_q(normalize(model))
+    if year:
+        condition &= year_q(int(year)) if make or model else dated_year_q(int(year))
+    return condition
@@ -0,0 +1,161 @@
+"""Typo-tolerant battery matching over a trigram index.
+
+Model numbers, battery names and brand names are compacted (lower-cased,
+punctuation and spaces removed, so "NS40 ZL", "ns40-zl" and "NS40ZL" are the
+same term) and split into padded trigrams. A query is scored against every
+term sharing at least one trigram with it using Jaccard similarity, and a
+battery scores as its best-matching term. The index lives in each worker,
+is rebuilt when the battery or brand catalog version moves and is patched in
+place for writes made by this process.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Battery
+from .search import pk_in
+from .versioning import VersionedIndex
+
+NON_ALNUM_RE = re.compile(r'[\W_]+')
+
+
+def compact(text):
+    return NON_ALNUM_RE.sub('', str(text).lower())
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def default_threshold():
+    return getattr(settings, 'BATTERY_FUZZY_THRESHOLD', 0.3)
+
+
+class TrigramIndexState:
+    def __init__(self):
+        self.postings = {}  # trigram -> set of term ids
+        self.terms = {}  # term id -> (battery id, trigram count)
+        self.term_ids = {}  # battery id -> [(term id, trigrams)]
+        self.batteries = {}  # battery id -> suggestion payload
+        self.next_term_id = 0
+
+    def add_battery(self, battery_id, name, brand_name, model_number, slug):
+        self.remove_battery(battery_id)
+        self.batteries[battery_id] = {'text': f"{brand_name} {name}", 'type': 'battery', 'slug': slug}
+        term_ids = []
+        for term in {compact(model_number), compact(name), compact(brand_name), compact(f'{brand_name}{name}')}:
+            if not term:
+                continue
+            grams = trigrams(term)
+            term_id = self.next_term_id
+            self.next_term_id += 1
+            self.terms[term_id] = (battery_id, len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(term_id)
+            term_ids.append((term_id, grams))
+        self.term_ids[battery_id] = term_ids
+
+    def remove_battery(self, battery_id):
+        self.batteries.pop(battery_id, None)
+        for term_id, grams in self.term_ids.pop(battery_id, ()):
+            del self.terms[term_id]
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is not None:
+                    posting.discard(term_id)
+                    if not posting:
+                        del self.postings[gram]
+
+    def match(self, query, threshold):
+        """(battery id, similarity) pairs at or above ``threshold``, most similar first, ties by id"""
+        query = compact(query)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        best = {}
+        for term_id, common in shared.items():
+            battery_id, size = self.terms[term_id]
+            similarity = common / (len(query_grams) + size - common)
+            if similarity >= threshold and similarity > best.get(battery_id, 0):
+                best[battery_id] = similarity
+        return sorted(best.items(), key=lambda item: (-item[1], str(item[0])))
+
+
+class TrigramIndex(VersionedIndex):
+    version_keys = ('battery', 'brand')
+
+    def build(self):
+        state = TrigramIndexState()
+        rows = Battery.objects.filter(is_active=True).values_list(
+            'pk', 'name', 'brand__name', 'model_number', 'slug'
+        )
+        for row in rows:
+            state.add_battery(*row)
+        return state
+
+    def match(self, query, threshold=None):
+        with self.reading() as state:
+            return state.match(query, default_threshold() if threshold is None else threshold)
+
+    def suggestions(self, query, limit):
+        with self.reading() as state:
+            return [state.batteries[battery_id] for battery_id, _ in state.match(query, default_threshold())[:limit]]
+
+    def patch_battery(self, new_versions, battery):
+        def apply(state):
+            if battery.is_active:
+                state.add_battery(battery.pk, battery.name, battery.brand.name, battery.model_number, battery.slug)
+            else:
+                state.remove_battery(battery.pk)
+        self.patch(new_versions, apply)
+
+    def patch_battery_removed(self, new_versions, battery_id):
+        self.patch(new_versions, lambda state: state.remove_battery(battery_id))
+
+
+trigram_index = TrigramIndex()
+
+
+class FuzzyMatchFilter(BaseFilterBackend):
+    """``?fuzzy=ns40 zl`` keeps batteries whose model number, name or brand is similar.
+
+    ``?fuzzy_threshold=`` (0.1-1.0) overrides BATTERY_FUZZY_THRESHOLD. Every
+    match is kept. Ranking by similarity is left to the view, which pages
+    over ``ranked_ids`` unless the request passes an explicit ordering (see
+    ``FuzzyListMixin`` in batteries/views.py).
+    """
+    fuzzy_param = 'fuzzy'
+    threshold_param = 'fuzzy_threshold'
+
+    def get_threshold(self, request):
+        try:
+            return min(max(float(request.query_params[self.threshold_param]), 0.1), 1.0)
+        except (KeyError, ValueError):
+            return default_threshold()
+
+    def ranked_ids(self, request):
+        """Ids of every matching battery, most similar first; None without ``?fuzzy=``"""
+        query = request.query_params.get(self.fuzzy_param, '').strip()
+        if not query:
+            return None
+        # The view and this filter both need the matches, so they are kept on the request
+        key = (query, self.get_threshold(request))
+        cached_key, ranked_ids = getattr(request, '_fuzzy_matches', (None, None))
+        if cached_key != key:
+            ranked_ids = [battery_id for battery_id, _ in trigram_index.match(*key)]
+            request._fuzzy_matches = (key, ranked_ids)
+        return ranked_ids
+
+    def filter_queryset(self, request, queryset, view):
+        ranked_ids = self.ranked_ids(request)
+        if ranked_ids is None:
+            return queryset
+        if not ranked_ids:
+            return queryset.none()
+        return queryset.filter(pk__in=pk_in(queryset.model, ranked_ids, queryset.db))
@@ -0,0 +1,85 @@
+"""Stock reservation at checkout and the inventory ledger.
+
+``reserve`` takes stock with one conditional ``UPDATE ... SET stock_quantity
+= stock_quantity - n WHERE stock_quantity >= n`` per battery, so two
+checkouts racing for the last unit cannot both succeed: the second update
+matches no row and the order's transaction rolls back. Batteries are updated
+in primary-key order so concurrent orders lock rows in the same sequence.
+Every change is recorded as an ``InventoryMovement``; ``stock_drift`` compares
+the ledger with stored stock and ``rebuild_stock`` restores stock from it.
+
+Queryset updates send no model signals, so ``stock_changed`` does what
+``batteries.signals`` would for a stock edit: bump the "stock" version,
+adjust the dashboard counters and refresh the responses tagged "stock" and
+the detail pages. The battery version, and with it the search indexes and
+counts that do not depend on stock, is left alone.
+"""
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import detail_cache, stats, versioning
+from .caching import invalidate_tags
+from .models import Battery, InventoryMovement
+
+
+class InsufficientStock(Exception):
+    def __init__(self, battery_id):
+        super().__init__(f'Not enough stock for battery {battery_id}')
+        self.battery_id = battery_id
+
+
+def reserve(quantities, order):
+    """Take ``{battery id: quantity}`` out of stock for ``order``; call inside a transaction.
+
+    Raises ``InsufficientStock`` for the first battery that cannot cover its quantity.
+    """
+    for battery_id in sorted(quantities):
+        taken = Battery.objects.filter(pk=battery_id, stock_quantity__gte=quantities[battery_id]).update(
+            stock_quantity=F('stock_quantity') - quantities[battery_id]
+        )
+        if not taken:
+            raise InsufficientStock(battery_id)
+    InventoryMovement.objects.bulk_create(
+        InventoryMovement(battery_id=battery_id, order=order, quantity=-quantity, reason='order')
+        for battery_id, quantity in quantities.items()
+    )
+    stock_changed({battery_id: True for battery_id in quantities})
+
+
+def stock_changed(was_in_stock):
+    """Propagate a queryset update of stock; ``was_in_stock`` maps battery ids to their previous in-stock state"""
+    versioning.bump('stock')
+    rows = Battery.objects.filter(pk__in=was_in_stock).values_list('pk', 'slug', 'is_active', 'stock_quantity')
+    slugs = []
+    in_stock_change = 0
+    for battery_id, slug, is_active, stock in rows:
+        slugs.append(slug)
+        if is_active:
+            in_stock_change += (stock > 0) - was_in_stock[battery_id]
+    stats.apply_delta({'in_stock_batteries': in_stock_change})
+    invalidate_tags('stock')
+    detail_cache.refresh(slugs)
+
+
+def ledger_balances():
+    """{battery id: sum of its movements}"""
+    return dict(InventoryMovement.objects.order_by().values('battery').annotate(total=Sum('quantity')).values_list('battery', 'total'))
+
+
+def stock_drift():
+    """{battery id: (stored stock, ledger balance)} for batteries whose stock disagrees with the ledger"""
+    balances = ledger_balances()
+    return {
+        battery_id: (stock, balances.get(battery_id, 0))
+        for battery_id, stock in Battery.objects.values_list('pk', 'stock_quantity')
+        if stock != balances.get(battery_id, 0)
+    }
+
+
+def rebuild_stock(drift):
+    """Set the stock of every battery in ``drift`` (as returned by ``stock_drift``) to its ledger balance"""
+    with transaction.atomic():
+        for battery_id, (stock, balance) in drift.items():
+            Battery.objects.filter(pk=battery_id).update(stock_quantity=max(balance, 0))
+        if drift:
+            stock_changed({battery_id: stock > 0 for battery_id, (stock, balance) in drift.items()})
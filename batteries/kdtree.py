@@ -0,0 +1,77 @@
+"""Static k-d tree over fixed-length numeric points.
+
+The tree is stored implicitly: points are reordered so that the median of
+every subrange ``[lo, hi)`` sits at ``(lo + hi) // 2`` with its left half
+before it and right half after it, splitting on axis ``depth % dimensions``.
+Box range searches and k-nearest-neighbour queries visit only the subranges
+that can still hold a match.
+"""
+import heapq
+
+
+class KDTree:
+    def __init__(self, points, payloads):
+        """``points`` are equal-length tuples of numbers; ``payloads[i]`` is returned for ``points[i]``"""
+        self.dimensions = len(points[0]) if points else 0
+        order = list(range(len(points)))
+        self._build(points, order, 0, len(order), 0)
+        self.points = [points[i] for i in order]
+        self.payloads = [payloads[i] for i in order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, points, order, lo, hi, depth):
+        stack = [(lo, hi, depth)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            axis = depth % self.dimensions
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def range_search(self, low, high):
+        """(point, payload) pairs with ``low[d] <= point[d] <= high[d]`` on every axis"""
+        found = []
+        stack = [(0, len(self.points), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            point = self.points[mid]
+            axis = depth % self.dimensions
+            if all(low[d] <= point[d] <= high[d] for d in range(self.dimensions)):
+                found.append((point, self.payloads[mid]))
+            if low[axis] <= point[axis]:
+                stack.append((lo, mid, depth + 1))
+            if point[axis] <= high[axis]:
+                stack.append((mid + 1, hi, depth + 1))
+        return found
+
+    def nearest(self, target, k, exclude=None):
+        """Up to ``k`` (squared distance, payload) pairs closest to ``target``, nearest first"""
+        best = []  # max-heap of (-distance, position)
+        stack = [(0, len(self.points), 0, 0)]
+        while stack:
+            lo, hi, depth, plane_distance = stack.pop()
+            # A subrange beyond a splitting plane further away than the current k-th match cannot hold a closer point
+            if lo >= hi or (len(best) == k and plane_distance >= -best[0][0]):
+                continue
+            mid = (lo + hi) // 2
+            point = self.points[mid]
+            axis = depth % self.dimensions
+            if self.payloads[mid] != exclude:
+                distance = sum((a - b) ** 2 for a, b in zip(point, target))
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, mid))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, mid))
+            offset = target[axis] - point[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if offset < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((*far, depth + 1, max(plane_distance, offset ** 2)))
+            stack.append((*near, depth + 1, plane_distance))
+        return [(-distance, self.payloads[mid]) for distance, mid in sorted(best, reverse=True)]
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from batteries import inventory
+from batteries.models import Battery
+
+
+class Command(BaseCommand):
+    help = 'Compare every battery\'s stock with its inventory ledger and optionally rebuild stock from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Set drifted stock to the ledger balance')
+
+    def handle(self, *args, **options):
+        drift = inventory.stock_drift()
+        names = Battery.objects.in_bulk(drift)
+        for battery_id, (stock, balance) in drift.items():
+            self.stdout.write(f'{names[battery_id].name} ({battery_id}): stock {stock}, ledger {balance}')
+        
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Stock matches the inventory ledger.'))
+        elif options['fix']:
+            inventory.rebuild_stock(drift)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stock of {len(drift)} batteries from the ledger.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} batteries drifted; run with --fix to rebuild their stock.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from batteries import stats
+from batteries.models import CatalogStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics from scratch and report drift in the materialized row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite the stored row with the recomputed counts')
+
+    def handle(self, *args, **options):
+        drift = stats.stats_drift()
+        for name, (stored, actual) in drift.items():
+            self.stdout.write(f'{name}: stored {stored}, actual {actual}')
+        
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Dashboard statistics are consistent.'))
+        elif options['fix']:
+            CatalogStats.objects.update_or_create(pk=stats.STATS_ROW_PK, defaults=stats.compute_stats())
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(drift)} drifted counters.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} counters drifted; run with --fix to repair.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from batteries import equivalents
+
+
+class Command(BaseCommand):
+    help = 'Recompute the equivalent-battery recommendations for the whole catalog'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = equivalents.compute_equivalents()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {count} equivalents ({equivalents.equivalents_count()} per battery, numpy: {"yes" if equivalents.numpy else "no"}).'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from batteries import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 battery search index from the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.search_available(using):
+            raise CommandError('The full-text search table does not exist; run migrate on an SQLite database first.')
+        
+        with transaction.atomic(using=using):
+            count = search.rebuild_index(using=using)
+        
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} active batteries for full-text search.'))
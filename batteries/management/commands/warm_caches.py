@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from batteries import warmup
+
+
+class Command(BaseCommand):
+    help = 'Pre-build serializers, search indexes and the shared catalog response caches (see CACHES), timing each step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default=None, help='Scheme and host the cached pages are served under (default: CACHE_WARMUP_BASE_URL)')
+        parser.add_argument('--details', type=int, default=None, help='Number of top battery detail pages to render (default: CACHE_WARMUP_DETAILS)')
+        parser.add_argument('--code-only', action='store_true', help='Skip the indexes and response caches')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        timings = warmup.warm_code()
+        if not options['code_only']:
+            timings += warmup.warm_data(options['base_url'], options['details'])
+        for step, seconds, note in timings:
+            self.stdout.write(f'{step}: {seconds * 1000:.1f} ms' + (f' ({note})' if note else ''))
+        self.stdout.write(self.style.SUCCESS(f'Warmed caches in {(time.perf_counter() - started) * 1000:.1f} ms.'))
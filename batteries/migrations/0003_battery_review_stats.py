@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_review_stats(apps, schema_editor):
+    Battery = apps.get_model('batteries', 'Battery')
+    Review = apps.get_model('batteries', 'Review')
+    rows = Review.objects.order_by().values('battery').annotate(
+        count=Count('pk'),
+        total=Sum('rating'),
+        **{f'r{n}': Count('pk', filter=Q(rating=n)) for n in range(1, 6)},
+    )
+    for row in rows:
+        Battery.objects.filter(pk=row['battery']).update(
+            review_count=row['count'],
+            rating_sum=row['total'],
+            average_rating=row['total'] / row['count'],
+            **{f'rating_{n}_count': row[f'r{n}'] for n in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0002_alter_brand_options_alter_category_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battery',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='battery',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='battery',
+            index=models.Index(fields=['average_rating', 'is_active'], name='batteries_b_average_6a7b10_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battery',
+            index=models.Index(fields=['review_count', 'is_active'], name='batteries_b_review__73a21d_idx'),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:33
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The parser from batteries.fitment, including its ENGINE_RE fix, is duplicated
+# here so the backfill does not change if that module does later
+YEAR_RANGE_RE = re.compile(r'\b((?:19|20)\d{2})(?:\s*(?:-|to)\s*((?:19|20)\d{2}|present|on|\+))?\b', re.IGNORECASE)
+ENGINE_RE = re.compile(r'\b(\d\.\d\s?[lL]?(?:\s?(?:TDI|VVT-?i|D-4D|[A-Z]{1,4}\d?))?)\b')
+
+
+def normalize(value):
+    return ' '.join(str(value).lower().split())
+
+
+def parse_years(text):
+    match = YEAR_RANGE_RE.search(text)
+    if not match:
+        return text, None, None
+    year_from = int(match.group(1))
+    end = match.group(2)
+    if end is None:
+        year_to = year_from
+    elif end.isdigit():
+        year_to = int(end)
+    else:
+        year_to = None
+    return text[:match.start()] + text[match.end():], year_from, year_to
+
+
+def parse_vehicle(entry, known_makes):
+    """Parse a ``compatible_vehicles`` entry such as ``"Toyota Hilux 2.5 D-4D 2005-2015"``"""
+    if isinstance(entry, dict):
+        return {
+            'make': str(entry.get('make', '')).strip(),
+            'model': str(entry.get('model', '')).strip(),
+            'year_from': entry.get('year_from'),
+            'year_to': entry.get('year_to'),
+            'engine': str(entry.get('engine', '')).strip(),
+        }
+
+    text, year_from, year_to = parse_years(str(entry))
+    engine = ''
+    match = ENGINE_RE.search(text)
+    if match:
+        engine = match.group(1).strip()
+        text = text[:match.start()] + text[match.end():]
+    words = text.split()
+
+    make = ''
+    lowered = normalize(text)
+    for known in sorted(known_makes, key=len, reverse=True):
+        key = normalize(known)
+        if key and (lowered == key or lowered.startswith(key + ' ')):
+            make = ' '.join(words[:len(key.split())])
+            words = words[len(key.split()):]
+            break
+    else:
+        if len(words) > 1:
+            make, words = words[0], words[1:]
+
+    return {
+        'make': make,
+        'model': ' '.join(words),
+        'year_from': year_from,
+        'year_to': year_to,
+        'engine': engine,
+    }
+
+
+def parse_fitments(compatible_vehicles, vehicle_makes, vehicle_models):
+    """Turn a battery's compatibility lists into fitment row dicts, without duplicates"""
+    makes = [str(make).strip() for make in vehicle_makes or [] if str(make).strip()]
+    rows = [parse_vehicle(entry, makes) for entry in compatible_vehicles or [] if entry]
+    rows = [row for row in rows if row['make'] or row['model']]
+
+    covered_makes = {normalize(row['make']) for row in rows}
+    covered_models = {normalize(row['model']) for row in rows}
+    rows += [
+        {'make': make, 'model': '', 'year_from': None, 'year_to': None, 'engine': ''}
+        for make in makes if normalize(make) not in covered_makes
+    ]
+    rows += [
+        {'make': '', 'model': str(model).strip(), 'year_from': None, 'year_to': None, 'engine': ''}
+        for model in vehicle_models or [] if str(model).strip() and normalize(model) not in covered_models
+    ]
+
+    unique = {}
+    for row in rows:
+        row['make_key'] = normalize(row['make'])
+        row['model_key'] = normalize(row['model'])
+        key = (row['make_key'], row['model_key'], row['year_from'], row['year_to'], row['engine'].lower())
+        unique.setdefault(key, row)
+    return list(unique.values())
+
+
+def backfill_fitments(apps, schema_editor):
+    Battery = apps.get_model('batteries', 'Battery')
+    VehicleFitment = apps.get_model('batteries', 'VehicleFitment')
+    fitments = []
+    for battery in Battery.objects.only('id', 'compatible_vehicles', 'vehicle_makes', 'vehicle_models').iterator():
+        rows = parse_fitments(battery.compatible_vehicles, battery.vehicle_makes, battery.vehicle_models)
+        fitments.extend(VehicleFitment(battery_id=battery.pk, **row) for row in rows)
+    VehicleFitment.objects.bulk_create(fitments, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0003_battery_review_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleFitment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make', models.CharField(blank=True, max_length=100)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('make_key', models.CharField(blank=True, help_text='Lower-cased make used for lookups', max_length=100)),
+                ('model_key', models.CharField(blank=True, help_text='Lower-cased model used for lookups', max_length=100)),
+                ('year_from', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('year_to', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('engine', models.CharField(blank=True, max_length=50)),
+                ('battery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fitments', to='batteries.battery')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['make_key', 'model_key'], name='batteries_v_make_ke_8ea6c8_idx'), models.Index(fields=['model_key'], name='batteries_v_model_k_f0586b_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_fitments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:40
+
+from django.db import migrations, OperationalError
+
+# The FTS5 table definition and initial load, kept here rather than imported
+# from batteries.search so later edits there cannot alter this migration
+FTS_TABLE = 'batteries_battery_fts'
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        battery_id UNINDEXED, name, model_number, brand_name,
+        description, short_description, vehicles,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (battery_id, name, model_number, brand_name, description, short_description, vehicles)
+    SELECT b.id, b.name, b.model_number, br.name, b.description, b.short_description, b.compatible_vehicles
+    FROM batteries_battery b INNER JOIN batteries_brand br ON br.id = b.brand_id
+    WHERE b.is_active
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_TABLE_SQL)
+    except OperationalError:
+        # SQLite built without FTS5; search falls back to LIKE queries
+        return
+    schema_editor.execute(INSERT_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0004_vehicle_fitment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
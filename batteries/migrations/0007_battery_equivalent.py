@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0006_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatteryEquivalent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('distance', models.FloatField(help_text='Distance between normalized spec vectors')),
+                ('battery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equivalents', to='batteries.battery')),
+                ('equivalent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equivalent_of', to='batteries.battery')),
+            ],
+            options={
+                'ordering': ['battery', 'rank'],
+                'indexes': [models.Index(fields=['battery', 'rank'], name='batteries_b_battery_5b7369_idx')],
+                'unique_together': {('battery', 'equivalent')},
+            },
+        ),
+    ]
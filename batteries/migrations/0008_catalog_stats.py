@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0007_battery_equivalent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_batteries', models.IntegerField(default=0)),
+                ('featured_batteries', models.IntegerField(default=0)),
+                ('popular_batteries', models.IntegerField(default=0)),
+                ('in_stock_batteries', models.IntegerField(default=0)),
+                ('total_brands', models.IntegerField(default=0)),
+                ('total_categories', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Catalog stats',
+            },
+        ),
+    ]
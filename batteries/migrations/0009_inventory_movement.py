@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_ledger(apps, schema_editor):
+    Battery = apps.get_model('batteries', 'Battery')
+    InventoryMovement = apps.get_model('batteries', 'InventoryMovement')
+    InventoryMovement.objects.bulk_create(
+        (
+            InventoryMovement(battery_id=battery_id, quantity=stock, reason='initial')
+            for battery_id, stock in Battery.objects.filter(stock_quantity__gt=0).values_list('pk', 'stock_quantity').iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batteries', '0008_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(help_text='Signed change in stock')),
+                ('reason', models.CharField(choices=[('initial', 'Initial stock'), ('adjustment', 'Adjustment'), ('order', 'Order')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('battery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='batteries.battery')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_movements', to='batteries.order')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['battery', 'created_at'], name='batteries_i_battery_29c623_idx')],
+            },
+        ),
+        migrations.RunPython(seed_ledger, migrations.RunPython.noop),
+    ]
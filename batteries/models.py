@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import DatabaseError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
@@ -52,6 +54,44 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def slug(self):
+        return self.name.lower().replace(' ', '-')
+
+class BatteryQuerySet(models.QuerySet):
+    def adjust_review_stats(self, rating, delta):
+        """Apply one review being added (delta=1) or removed (delta=-1) to the stored statistics"""
+        self.update(**{
+            'review_count': F('review_count') + delta,
+            'rating_sum': F('rating_sum') + delta * rating,
+            f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+        })
+        return self.update(average_rating=Case(
+            When(review_count__lte=0, then=Value(0.0)),
+            default=Cast('rating_sum', models.FloatField()) / F('review_count'),
+        ))
+
+    def refresh_review_stats(self):
+        """Recompute the stored review statistics from scratch"""
+        totals = {
+            row['battery']: row
+            for row in Review.objects.filter(battery__in=self.values('pk')).order_by().values('battery').annotate(
+                count=Count('pk'),
+                total=Sum('rating'),
+                **{f'r{n}': Count('pk', filter=Q(rating=n)) for n in range(1, 6)},
+            )
+        }
+        batteries = list(self)
+        for battery in batteries:
+            row = totals.get(battery.pk)
+            battery.review_count = row['count'] if row else 0
+            battery.rating_sum = row['total'] if row else 0
+            for n in range(1, 6):
+                setattr(battery, f'rating_{n}_count', row[f'r{n}'] if row else 0)
+            battery.average_rating = battery.rating_sum / battery.review_count if battery.review_count else 0
+        Battery.objects.bulk_update(batteries, Battery.REVIEW_STATS_FIELDS)
+        return len(batteries)
+
 class Battery(models.Model):
     CONDITION_CHOICES = [
         ('new', 'New'),
@@ -65,6 +105,11 @@ class Battery(models.Model):
         ('6V', '6 Volt'),
     ]
 
+    REVIEW_STATS_FIELDS = [
+        'review_count', 'rating_sum', 'average_rating',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    ]
+
     # Basic Information
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200)
@@ -119,10 +164,22 @@ class Battery(models.Model):
     # Seller Information
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='batteries_for_sale')
     
+    # Review Statistics - maintained on review create/delete, never edit by hand
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BatteryQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -131,11 +188,47 @@ class Battery(models.Model):
             models.Index(fields=['brand', 'is_active']),
             models.Index(fields=['price', 'is_active']),
             models.Index(fields=['voltage', 'is_active']),
+            models.Index(fields=['average_rating', 'is_active']),
+            models.Index(fields=['review_count', 'is_active']),
         ]
 
     def __str__(self):
         return f"{self.brand.name} {self.name} - {self.model_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock_quantity')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Review statistics are maintained with F() updates, and checkouts take stock the
+        # same way, so a plain save of a loaded instance never writes back a possibly stale
+        # copy; stock is written only when it was changed on this instance
+        loaded = not self._state.adding and self._state.db is not None and self.pk is not None
+        if not loaded or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+            super().save(*args, **kwargs)
+        else:
+            kwargs.pop('update_fields', None)
+            skipped = set(self.REVIEW_STATS_FIELDS)
+            if self.__dict__.get('stock_quantity') == getattr(self, '_loaded_stock', None):
+                skipped.add('stock_quantity')
+            fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
+            using = kwargs.get('using') or self._state.db
+            try:
+                with transaction.atomic(using=using):
+                    super().save(*args, update_fields=fields, **kwargs)
+            except DatabaseError:
+                # The row was deleted after this instance was loaded; write it back in
+                # full, as a plain save would
+                if type(self)._base_manager.using(using).filter(pk=self.pk).exists():
+                    raise
+                super().save(*args, **kwargs)
+        self._loaded_stock = self.__dict__.get('stock_quantity')
+
     @property
     def discount_percentage(self):
         if self.original_price and self.original_price > self.price:
@@ -146,6 +239,65 @@ class Battery(models.Model):
     def is_in_stock(self):
         return self.stock_quantity > 0
 
+    @property
+    def rating_histogram(self):
+        return {str(n): getattr(self, f'rating_{n}_count') for n in range(1, 6)}
+
+class VehicleFitment(models.Model):
+    """Normalized, indexed form of a battery's vehicle compatibility lists.
+
+    Rows are rebuilt from compatible_vehicles, vehicle_makes and vehicle_models
+    whenever the battery is saved; edit those fields rather than these rows.
+    """
+    battery = models.ForeignKey(Battery, on_delete=models.CASCADE, related_name='fitments')
+    make = models.CharField(max_length=100, blank=True)
+    model = models.CharField(max_length=100, blank=True)
+    make_key = models.CharField(max_length=100, blank=True, help_text="Lower-cased make used for lookups")
+    model_key = models.CharField(max_length=100, blank=True, help_text="Lower-cased model used for lookups")
+    year_from = models.PositiveSmallIntegerField(blank=True, null=True)
+    year_to = models.PositiveSmallIntegerField(blank=True, null=True)
+    engine = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['make_key', 'model_key']),
+            models.Index(fields=['model_key']),
+        ]
+
+    def __str__(self):
+        years = f" {self.year_from or ''}-{self.year_to or ''}" if self.year_from or self.year_to else ''
+        return f"{self.make} {self.model}{years}".strip()
+
+    @classmethod
+    def sync_battery(cls, battery):
+        from .fitment import parse_fitments
+        with transaction.atomic():
+            cls.objects.filter(battery=battery).delete()
+            cls.objects.bulk_create(
+                cls(battery=battery, **row)
+                for row in parse_fitments(battery.compatible_vehicles, battery.vehicle_makes, battery.vehicle_models)
+            )
+
+class BatteryEquivalent(models.Model):
+    """Precomputed nearest batteries by specification, within the same voltage.
+
+    Maintained by ``batteries.equivalents``; lower ``rank`` means closer.
+    """
+    battery = models.ForeignKey(Battery, on_delete=models.CASCADE, related_name='equivalents')
+    equivalent = models.ForeignKey(Battery, on_delete=models.CASCADE, related_name='equivalent_of')
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField(help_text="Distance between normalized spec vectors")
+
+    class Meta:
+        ordering = ['battery', 'rank']
+        unique_together = ['battery', 'equivalent']
+        indexes = [
+            models.Index(fields=['battery', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.battery} ~ {self.equivalent}"
+
 class BatteryImage(models.Model):
     battery = models.ForeignKey(Battery, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='batteries/')
@@ -249,3 +401,57 @@ class Wishlist(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.battery.name}"
+
+class CatalogVersion(models.Model):
+    """Monotonic change counter per data set, used to invalidate in-process indexes and caches"""
+    key = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+class CatalogStats(models.Model):
+    """Materialized dashboard counters, kept current by signals when DASHBOARD_STATS_MATERIALIZED is on.
+
+    A single row (pk=1). Run ``check_dashboard_stats --fix`` after bulk
+    writes that bypass model signals.
+    """
+    total_batteries = models.IntegerField(default=0)
+    featured_batteries = models.IntegerField(default=0)
+    popular_batteries = models.IntegerField(default=0)
+    in_stock_batteries = models.IntegerField(default=0)
+    total_brands = models.IntegerField(default=0)
+    total_categories = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Catalog stats"
+
+    def __str__(self):
+        return f"Catalog stats: {self.total_batteries} batteries"
+
+class InventoryMovement(models.Model):
+    """Append-only stock ledger: the movements of a battery sum to its ``stock_quantity``.
+
+    Checkout reservations and saved stock edits add rows; run
+    ``audit_inventory`` to compare the ledger with stored stock.
+    """
+    REASON_CHOICES = [
+        ('initial', 'Initial stock'),
+        ('adjustment', 'Adjustment'),
+        ('order', 'Order'),
+    ]
+
+    battery = models.ForeignKey(Battery, on_delete=models.CASCADE, related_name='inventory_movements')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_movements')
+    quantity = models.IntegerField(help_text="Signed change in stock")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['battery', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity:+d} {self.battery.name} ({self.reason})"
@@ -0,0 +1,236 @@
+"""List pagination: cached page-number counts and per-request keyset pagination.
+
+``CachedCountPagination`` caches the ``COUNT(*)`` behind page-number pages,
+keyed by the request's filter parameters and the catalog versions the view
+declares in ``count_version_keys``. With ``?count=estimated`` a count above
+``count_estimate_threshold`` is extrapolated from a primary-key sample instead
+of counted, and ``count_exact`` in the response says which one the client got.
+
+For keyset pagination, infinite-scroll clients pass ``?pagination=cursor``
+(or follow a ``cursor`` link); everyone else keeps page numbers. Instead of
+``COUNT(*)`` and ``OFFSET``, a page is ``WHERE (ordering fields) > (last
+row's values)`` with the primary key appended to the ordering as a
+tie-breaker, so deep pages cost the same as the first one. The cursor is the
+URL-safe base64 of a small JSON object holding those values and the
+direction.
+"""
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import uuid
+from functools import partial, reduce
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import versioning
+
+
+def cursor_requested(request):
+    return 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor'
+
+
+def encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.__dict__['count'] = count
+
+
+class CachedCountPagination(PageNumberPagination):
+    """Page-number pagination whose counts are cached per filter set and catalog version.
+
+    Only views declaring ``count_version_keys`` are cached; their results must
+    not depend on who is asking.
+    """
+    count_query_param = 'count'
+    count_estimate_threshold = 1000
+    count_sample_size = 1000
+    # Parameters that never change which rows match
+    uncounted_params = {'page', 'page_size', 'ordering', 'format', 'expand', 'count', 'cursor', 'pagination'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.version_keys = getattr(view, 'count_version_keys', None)
+        self.count_exact = True
+        count = None
+        if self.version_keys and isinstance(queryset, QuerySet):
+            count = self.get_count(queryset, request, view)
+        self.django_paginator_class = partial(CountedPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view)
+
+    def count_cache_key(self, request, kind, versions, filtered=True):
+        """Cache key of a count of ``request.path``, for its filter parameters unless ``filtered`` is False"""
+        params = sorted(
+            (name, value.strip())
+            for name, values in request.query_params.lists() if name not in self.uncounted_params
+            for value in values if value.strip()
+        ) if filtered else []
+        digest = hashlib.md5(json.dumps([request.path, params, versions], sort_keys=True).encode()).hexdigest()
+        return f'list-count:{kind}:{digest}'
+
+    def get_count(self, queryset, request, view):
+        versions = versioning.get_versions(self.version_keys)
+        exact_key = self.count_cache_key(request, 'exact', versions)
+        count = cache.get(exact_key)
+        if count is not None:
+            return count
+        queryset = queryset.order_by()
+        if request.query_params.get(self.count_query_param) == 'estimated':
+            capped = queryset[:self.count_estimate_threshold + 1].count()
+            if capped > self.count_estimate_threshold:
+                self.count_exact = False
+                return cache.get_or_set(
+                    self.count_cache_key(request, 'estimated', versions),
+                    lambda: self.estimate_count(queryset, view, versions),
+                )
+            count = capped
+        else:
+            count = queryset.count()
+        cache.set(exact_key, count)
+        return count
+
+    def estimate_count(self, queryset, view, versions):
+        """Extrapolate from the share of matches among a primary-key sample of the view's rows.
+
+        Random (UUID) primary keys make the first rows by key a uniform sample.
+        """
+        base = view.get_queryset().order_by()
+        total = cache.get_or_set(self.count_cache_key(view.request, 'total', versions, filtered=False), base.count)
+        sample = base.order_by('pk').values('pk')[:self.count_sample_size]
+        matched = queryset.filter(pk__in=sample).count()
+        estimate = round(total * matched / min(total, self.count_sample_size)) if total else 0
+        return max(estimate, self.count_estimate_threshold + 1)
+
+    def get_paginated_response(self, data):
+        if not self.version_keys:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.page.paginator.count,
+            'count_exact': self.count_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over the queryset's own field ordering plus the primary key.
+
+    Orderings that are not plain (non-null) field names, such as search
+    relevance, are replaced with the view's default ``ordering``.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            return max(1, min(int(request.query_params[self.page_size_query_param]), self.max_page_size))
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by)
+        if not ordering or not all(isinstance(term, str) for term in ordering):
+            ordering = list(getattr(view, 'ordering', None) or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if pk_name not in {term.lstrip('-') for term in ordering}:
+            ordering.append(('-' if ordering and ordering[-1].startswith('-') else '') + pk_name)
+        return ordering
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = [
+                model._meta.get_field(term.lstrip('-')).to_python(value)
+                for term, value in zip(ordering, data['v'], strict=True)
+            ]
+            return values, bool(data.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        values = [encode_value(self.value(item, term.lstrip('-'))) for term in self.ordering]
+        encoded = base64.urlsafe_b64encode(json.dumps({'v': values, 'r': reverse}).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def value(item, field):
+        return item[field] if isinstance(item, dict) else getattr(item, field)
+
+    @staticmethod
+    def after(ordering, values, reverse):
+        """Rows strictly past ``values`` in ``ordering`` (before them when ``reverse``)"""
+        conditions = []
+        for position, term in enumerate(ordering):
+            field = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') != reverse else 'gt'
+            equal = {ordering[i].lstrip('-'): values[i] for i in range(position)}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': values[position]}))
+        return reduce(lambda left, right: left | right, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        self.ordering = self.get_ordering(queryset, view)
+        values, reverse = self.decode_cursor(request, queryset.model, self.ordering)
+
+        if reverse:
+            ordering = [term[1:] if term.startswith('-') else f'-{term}' for term in self.ordering]
+        else:
+            ordering = self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(self.ordering, values, reverse))
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_link = self.previous_link = None
+        if page:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(page[-1], reverse=False)
+            if (has_more and reverse) or (values is not None and not reverse):
+                self.previous_link = self.encode_cursor(page[0], reverse=True)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
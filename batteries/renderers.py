@@ -0,0 +1,107 @@
+"""JSON rendering with an optional fast encoder and pre-encoded fragments.
+
+``FastJSONRenderer`` renders the same JSON values as DRF's ``JSONRenderer``.
+When ``orjson`` is installed it is used for compact output, otherwise, and
+for data orjson cannot encode such as integers beyond 64 bits, rendering
+falls back to the standard library encoder. orjson output is byte-for-byte
+the same except for floats with an exponent (``1e16`` rather than
+``1e+16``) and for NaN and infinities, which it writes as ``null`` where
+``JSONRenderer`` rejects them. Either way, a ``JSONFragment``
+anywhere in the data is spliced into the output verbatim instead of being
+re-encoded, which lets cached payloads (brand or category blobs, whole
+detail responses) skip serialization entirely.
+"""
+import json
+import uuid
+from functools import partial
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class JSONFragment:
+    """Already-encoded JSON that renderers must emit as-is"""
+    __slots__ = ('content',)
+
+    def __init__(self, content):
+        self.content = content.encode() if isinstance(content, str) else bytes(content)
+
+    def __repr__(self):
+        return f'JSONFragment({self.content[:40]!r})'
+
+
+class FragmentCollector:
+    """Swaps fragments for unique placeholder strings that are replaced after encoding"""
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.fragments = []
+
+    def placeholder(self, fragment):
+        self.fragments.append(fragment.content)
+        return f'\x00{self.token}:{len(self.fragments) - 1}\x00'
+
+    def splice(self, ret):
+        for index, content in enumerate(self.fragments):
+            ret = ret.replace(f'"\\u0000{self.token}:{index}\\u0000"'.encode(), content, 1)
+        return ret
+
+
+class FragmentEncoder(encoders.JSONEncoder):
+    def __init__(self, *args, collector=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collector = collector
+
+    def default(self, obj):
+        if isinstance(obj, JSONFragment):
+            return self.collector.placeholder(obj)
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    orjson_options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+    # DRF's encoder.default() is stateless, so one instance handles the types orjson passes through
+    fallback_encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, JSONFragment):
+            return data.content
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        collector = FragmentCollector()
+
+        ret = None
+        if orjson is not None and indent is None and self.compact and not self.ensure_ascii:
+            try:
+                ret = orjson.dumps(data, default=partial(self.orjson_default, collector), option=self.orjson_options)
+            except orjson.JSONEncodeError:
+                collector = FragmentCollector()
+        if ret is None:
+            ret = self.render_stdlib(data, indent, collector)
+        # Match JSONRenderer: these are valid JSON but break JavaScript string literals
+        ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return collector.splice(ret)
+
+    def orjson_default(self, collector, obj):
+        if isinstance(obj, JSONFragment):
+            return collector.placeholder(obj)
+        return self.fallback_encoder.default(obj)
+
+    def render_stdlib(self, data, indent, collector):
+        if indent is None:
+            separators = (',', ':') if self.compact else (', ', ': ')
+        else:
+            separators = (',', ': ')
+        return json.dumps(
+            data, cls=FragmentEncoder, collector=collector,
+            indent=indent, ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict, separators=separators,
+        ).encode()
@@ -0,0 +1,142 @@
+"""SQLite FTS5 full-text search over the battery catalog.
+
+``batteries_battery_fts`` holds one row per active battery with its name,
+model number, brand name, descriptions and compatible vehicles. Signals keep
+it in step with Battery and Brand writes, and ``rebuild_search_index``
+repopulates it in bulk. On databases without the table (non-SQLite, or FTS5
+unavailable) ``FullTextSearchFilter`` behaves exactly like DRF's SearchFilter.
+"""
+import json
+import uuid
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+FTS_TABLE = 'batteries_battery_fts'
+
+# bm25 weights in column order: battery_id, name, model_number, brand_name,
+# description, short_description, vehicles
+BM25_WEIGHTS = (0.0, 10.0, 10.0, 5.0, 1.0, 2.0, 3.0)
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        battery_id UNINDEXED, name, model_number, brand_name,
+        description, short_description, vehicles,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (battery_id, name, model_number, brand_name, description, short_description, vehicles)
+    SELECT b.id, b.name, b.model_number, br.name, b.description, b.short_description, b.compatible_vehicles
+    FROM batteries_battery b INNER JOIN batteries_brand br ON br.id = b.brand_id
+    WHERE b.is_active
+"""
+
+_available = {}
+
+
+def search_available(using=DEFAULT_DB_ALIAS):
+    # Only a positive answer is cached: the table may be created by a migration later in this process
+    if not _available.get(using):
+        connection = connections[using]
+        _available[using] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available[using]
+
+
+def match_expression(text):
+    """Quote each word as an FTS5 prefix term so user input can never be parsed as query syntax"""
+    terms = [word.replace('"', '""') for word in text.replace(',', ' ').split()]
+    return ' '.join(f'"{term}"*' for term in terms if term.strip('"'))
+
+
+def index_batteries(battery_ids, using=DEFAULT_DB_ALIAS):
+    """Re-index the given batteries; inactive ones are dropped from the index"""
+    if not search_available(using):
+        return
+    keys = [uuid.UUID(str(pk)).hex for pk in battery_ids]
+    if not keys:
+        return
+    placeholders = ', '.join(['%s'] * len(keys))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE battery_id IN ({placeholders})', keys)
+        cursor.execute(f'{INSERT_SQL} AND b.id IN ({placeholders})', keys)
+
+
+def remove_batteries(battery_ids, using=DEFAULT_DB_ALIAS):
+    if not search_available(using):
+        return
+    keys = [uuid.UUID(str(pk)).hex for pk in battery_ids]
+    if not keys:
+        return
+    placeholders = ', '.join(['%s'] * len(keys))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE battery_id IN ({placeholders})', keys)
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    """Repopulate the whole index in one statement and return the number of indexed batteries"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(INSERT_SQL)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def match_subquery(term):
+    """``SELECT battery_id`` of the indexed batteries with a word starting with ``term``"""
+    return RawSQL(f'SELECT battery_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match_expression(term)])
+
+
+def rank_expression(terms, model, using=DEFAULT_DB_ALIAS):
+    """bm25 rank of each row against any of ``terms``; NULL for rows matching none of them"""
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    quote = connections[using].ops.quote_name
+    return RawSQL(
+        f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND battery_id = {quote(model._meta.db_table)}.{quote(model._meta.pk.column)}',
+        [' OR '.join(match_expression(term) for term in terms)],
+        output_field=FloatField(),
+    )
+
+
+def pk_in(model, ids, using=DEFAULT_DB_ALIAS):
+    """Right-hand side of ``pk__in`` for ``ids``; one parameter on SQLite, which caps their number"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return list(ids)
+    pk = model._meta.pk
+    return RawSQL('SELECT value FROM json_each(%s)', [json.dumps([pk.get_db_prep_value(value, connection) for value in ids])])
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """``?search=`` answered from the FTS5 index, ranked by bm25.
+
+    Every word must start a word of the indexed text or appear anywhere in the
+    model number. Matching and ranking both run inside the list query, so
+    counts and pagination cover every match. The bm25 order applies unless
+    the request passes an explicit ordering, so this backend must come after
+    OrderingFilter in ``filter_backends``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not search_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        terms = [term for term in self.get_search_terms(request) if match_expression(term)]
+        if not terms:
+            return queryset
+        for term in terms:
+            # Index words only match by prefix, so "40ZL" still needs a substring test to find "NS40ZL"
+            queryset = queryset.filter(Q(pk__in=match_subquery(term)) | Q(model_number__icontains=term))
+        if api_settings.ORDERING_PARAM not in request.query_params:
+            queryset = queryset.alias(search_rank=rank_expression(terms, queryset.model, queryset.db)).order_by(
+                F('search_rank').asc(nulls_last=True), 'pk'
+            )
+        return queryset
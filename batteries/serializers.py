@@ -1,10 +1,53 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import models, transaction
+from . import inventory
 from .models import (
     Battery, BatteryImage, Brand, Category,
     Review, Order, OrderItem, Wishlist
 )
 
+def attach_primary_images(batteries):
+    """Resolve the primary image of every battery in one query.
+
+    Falls back to the lowest-order image when none is flagged primary and
+    stores the result on ``battery._primary_image``.
+    """
+    pending = {}
+    for battery in batteries:
+        if not hasattr(battery, '_primary_image'):
+            pending.setdefault(battery.pk, []).append(battery)
+    if not pending:
+        return
+    images = BatteryImage.objects.filter(battery_id__in=pending).order_by(
+        'battery_id', '-is_primary', 'order', 'created_at'
+    ).only('id', 'battery_id', 'image', 'is_primary', 'order')
+    primary = {}
+    for image in images:
+        primary.setdefault(image.battery_id, image)
+    for battery_id, instances in pending.items():
+        for battery in instances:
+            battery._primary_image = primary.get(battery_id)
+
+def primary_image_url(serializer, battery):
+    if not hasattr(battery, '_primary_image'):
+        attach_primary_images([battery])
+    primary_img = battery._primary_image
+    if primary_img:
+        request = serializer.context.get('request')
+        if request:
+            return request.build_absolute_uri(primary_img.image.url)
+    return None
+
+class PrimaryImageListSerializer(serializers.ListSerializer):
+    """Loads primary images for the whole page before the rows are rendered"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        attach_primary_images(self.child.batteries_for_images(items))
+        return super().to_representation(items)
+
 class BrandSerializer(serializers.ModelSerializer):
     battery_count = serializers.SerializerMethodField()
     
@@ -13,8 +56,40 @@ class BrandSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'logo', 'description', 'website', 'country', 'is_popular', 'battery_count']
     
     def get_battery_count(self, obj):
+        counts = self.context.get('brand_battery_counts')
+        if counts is not None:
+            return counts.get(obj.pk, 0)
         return obj.batteries.filter(is_active=True).count()
 
+class BrandSummarySerializer(serializers.ModelSerializer):
+    """Compact brand embedded in battery payloads"""
+    slug = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = Brand
+        fields = ['id', 'name', 'slug']
+
+def brand_battery_counts():
+    return dict(
+        Battery.objects.filter(is_active=True).order_by().values('brand_id')
+        .annotate(count=models.Count('pk')).values_list('brand_id', 'count')
+    )
+
+def category_tree_context(categories):
+    """Serializer context that lets CategorySerializer render a tree without per-node queries.
+
+    ``categories`` must hold every active category in display order.
+    """
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_category_id, []).append(category)
+    counts = dict(
+        Battery.categories.through.objects.filter(battery__is_active=True)
+        .order_by().values('category_id').annotate(count=models.Count('battery_id'))
+        .values_list('category_id', 'count')
+    )
+    return {'category_children': children, 'category_battery_counts': counts}
+
 class CategorySerializer(serializers.ModelSerializer):
     battery_count = serializers.SerializerMethodField()
     subcategories = serializers.SerializerMethodField()
@@ -28,12 +103,55 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
     
     def get_battery_count(self, obj):
+        counts = self.context.get('category_battery_counts')
+        if counts is not None:
+            return counts.get(obj.pk, 0)
         return obj.batteries.filter(is_active=True).count()
     
     def get_subcategories(self, obj):
-        subcategories = obj.subcategories.filter(is_active=True).order_by('display_order', 'name')
+        children = self.context.get('category_children')
+        if children is not None:
+            subcategories = children.get(obj.pk, [])
+        else:
+            subcategories = obj.subcategories.filter(is_active=True).order_by('display_order', 'name')
         return CategorySerializer(subcategories, many=True, context=self.context).data
 
+class CategorySummarySerializer(serializers.ModelSerializer):
+    """Compact category embedded in battery payloads"""
+    
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'category_type']
+
+def requested_expansions(request):
+    """Embedded relations the client asked to receive in full via ``?expand=brand,categories``"""
+    if request is None:
+        return set()
+    return {name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()}
+
+def expansion_context(request):
+    """Bulk-loaded counts and tree so expanded brands and categories cost no per-row queries"""
+    expand = requested_expansions(request)
+    context = {}
+    if 'brand' in expand:
+        context['brand_battery_counts'] = brand_battery_counts()
+    if 'categories' in expand:
+        context.update(category_tree_context(Category.objects.filter(is_active=True).order_by('display_order', 'name')))
+    return context
+
+class ExpandableEmbedsMixin:
+    """Embeds compact brand/category forms unless the request opts into the full ones"""
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = requested_expansions(self.context.get('request'))
+        fields['brand'] = BrandSerializer(read_only=True) if 'brand' in expand else BrandSummarySerializer(read_only=True)
+        if 'categories' in expand:
+            fields['categories'] = CategorySerializer(many=True, read_only=True)
+        else:
+            fields['categories'] = CategorySummarySerializer(many=True, read_only=True)
+        return fields
+
 class BatteryImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = BatteryImage
@@ -49,9 +167,16 @@ class ReviewSerializer(serializers.ModelSerializer):
             'is_verified_purchase', 'created_at'
         ]
 
-class BatteryListSerializer(serializers.ModelSerializer):
-    brand = BrandSerializer(read_only=True)
-    categories = CategorySerializer(many=True, read_only=True)
+class ReviewStatsMixin:
+    """Rating fields read from the statistics stored on Battery"""
+
+    def get_average_rating(self, obj):
+        return round(obj.average_rating, 1) if obj.review_count else 0
+    
+    def get_review_count(self, obj):
+        return obj.review_count
+
+class BatteryListSerializer(ExpandableEmbedsMixin, ReviewStatsMixin, serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
@@ -65,27 +190,17 @@ class BatteryListSerializer(serializers.ModelSerializer):
             'stock_quantity', 'discount_percentage', 'slug', 'primary_image', 
             'average_rating', 'review_count', 'created_at'
         ]
+        list_serializer_class = PrimaryImageListSerializer
     
-    def get_primary_image(self, obj):
-        primary_img = obj.images.filter(is_primary=True).first()
-        if primary_img:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(primary_img.image.url)
-        return None
+    @staticmethod
+    def batteries_for_images(batteries):
+        return batteries
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
-        return 0
+    def get_primary_image(self, obj):
+        return primary_image_url(self, obj)
     
-    def get_review_count(self, obj):
-        return obj.reviews.count()
 
-class BatteryDetailSerializer(serializers.ModelSerializer):
-    brand = BrandSerializer(read_only=True)
-    categories = CategorySerializer(many=True, read_only=True)
+class BatteryDetailSerializer(ExpandableEmbedsMixin, ReviewStatsMixin, serializers.ModelSerializer):
     images = BatteryImageSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
     seller_name = serializers.CharField(source='seller.username', read_only=True)
@@ -105,14 +220,6 @@ class BatteryDetailSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
-        return 0
-    
-    def get_review_count(self, obj):
-        return obj.reviews.count()
 
 class OrderItemSerializer(serializers.ModelSerializer):
     battery_name = serializers.CharField(source='battery.name', read_only=True)
@@ -124,14 +231,14 @@ class OrderItemSerializer(serializers.ModelSerializer):
             'id', 'battery', 'battery_name', 'battery_image', 
             'quantity', 'unit_price', 'total_price'
         ]
+        list_serializer_class = PrimaryImageListSerializer
+    
+    @staticmethod
+    def batteries_for_images(items):
+        return [item.battery for item in items]
     
     def get_battery_image(self, obj):
-        primary_img = obj.battery.images.filter(is_primary=True).first()
-        if primary_img:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(primary_img.image.url)
-        return None
+        return primary_image_url(self, obj.battery)
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -145,9 +252,23 @@ class OrderSerializer(serializers.ModelSerializer):
             'shipping_postal_code', 'shipping_country', 'phone_number',
             'items', 'created_at', 'updated_at', 'shipped_at', 'delivered_at'
         ]
+        list_serializer_class = PrimaryImageListSerializer
+    
+    @staticmethod
+    def batteries_for_images(orders):
+        return [item.battery for order in orders for item in order.items.all()]
+
+SHIPPING_COST = Decimal('50.00')
+FREE_SHIPPING_THRESHOLD = Decimal('500.00')
+TAX_RATE = Decimal('0.10')
+CENT = Decimal('0.01')
+
+class OrderLineSerializer(serializers.Serializer):
+    battery_id = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1)
 
 class CreateOrderSerializer(serializers.ModelSerializer):
-    items = serializers.ListField(write_only=True)
+    items = serializers.ListField(child=OrderLineSerializer(), allow_empty=False, write_only=True)
     
     class Meta:
         model = Order
@@ -156,46 +277,68 @@ class CreateOrderSerializer(serializers.ModelSerializer):
             'shipping_country', 'phone_number', 'items'
         ]
     
+    def validate_items(self, items):
+        """Loads every battery of the cart in one query into ``self.batteries``, totals into ``self.quantities``"""
+        self.batteries = Battery.objects.in_bulk({item['battery_id'] for item in items})
+        self.quantities = {}
+        for item in items:
+            self.quantities[item['battery_id']] = self.quantities.get(item['battery_id'], 0) + item['quantity']
+        errors = []
+        for battery_id, quantity in self.quantities.items():
+            battery = self.batteries.get(battery_id)
+            if battery is None:
+                errors.append(f"Battery {battery_id} does not exist.")
+            elif not battery.is_active:
+                errors.append(f'{battery.name} is no longer available.')
+            elif battery.stock_quantity < quantity:
+                errors.append(self.stock_error(battery))
+        if errors:
+            raise serializers.ValidationError(errors)
+        return items
+    
+    @staticmethod
+    def stock_error(battery):
+        return f'Not enough stock for {battery.name}.'
+    
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         user = self.context['request'].user
         
-        # Calculate totals
-        subtotal = 0
         order_items = []
-        
         for item_data in items_data:
-            battery = Battery.objects.get(id=item_data['battery_id'])
+            battery = self.batteries[item_data['battery_id']]
             quantity = item_data['quantity']
-            unit_price = battery.price
-            total_price = quantity * unit_price
-            subtotal += total_price
-            
-            order_items.append({
-                'battery': battery,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'total_price': total_price
-            })
+            order_items.append(OrderItem(
+                battery=battery,
+                quantity=quantity,
+                unit_price=battery.price,
+                total_price=quantity * battery.price,
+            ))
+        subtotal = sum((item.total_price for item in order_items), Decimal('0.00'))
         
-        # Calculate shipping and tax (you can customize this logic)
-        shipping_cost = 50.00 if subtotal < 500 else 0  # Free shipping over $500
-        tax_amount = subtotal * 0.1  # 10% tax
+        # Free shipping over 500, 10% tax
+        shipping_cost = SHIPPING_COST if subtotal < FREE_SHIPPING_THRESHOLD else Decimal('0.00')
+        tax_amount = (subtotal * TAX_RATE).quantize(CENT, rounding=ROUND_HALF_UP)
         total_amount = subtotal + shipping_cost + tax_amount
         
-        # Create order
-        order = Order.objects.create(
-            user=user,
-            subtotal=subtotal,
-            shipping_cost=shipping_cost,
-            tax_amount=tax_amount,
-            total_amount=total_amount,
-            **validated_data
-        )
-        
-        # Create order items
-        for item_data in order_items:
-            OrderItem.objects.create(order=order, **item_data)
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                subtotal=subtotal,
+                shipping_cost=shipping_cost,
+                tax_amount=tax_amount,
+                total_amount=total_amount,
+                **validated_data
+            )
+            for item in order_items:
+                item.order = order
+            # bulk_create skips OrderItem.save(), so total_price is set above
+            OrderItem.objects.bulk_create(order_items)
+            try:
+                # Stock may have sold out since validation; this check is the authoritative one
+                inventory.reserve(self.quantities, order)
+            except inventory.InsufficientStock as error:
+                raise serializers.ValidationError({'items': [self.stock_error(self.batteries[error.battery_id])]})
         
         return order
 
@@ -205,6 +348,11 @@ class WishlistSerializer(serializers.ModelSerializer):
     class Meta:
         model = Wishlist
         fields = ['id', 'battery', 'created_at']
+        list_serializer_class = PrimaryImageListSerializer
+    
+    @staticmethod
+    def batteries_for_images(items):
+        return [item.battery for item in items]
 
 class CreateReviewSerializer(serializers.ModelSerializer):
     class Meta:
@@ -214,7 +362,20 @@ class CreateReviewSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['user'] = user
-        return super().create(validated_data)
+        # The post_save signal updates the battery's review statistics in the same transaction
+        with transaction.atomic():
+            return super().create(validated_data)
+
+class FitSearchSerializer(serializers.Serializer):
+    """Query parameters of the physical-fit search; dimensions are in cm"""
+    length = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'))
+    width = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'))
+    height = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'))
+    tolerance = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), default=Decimal('0.50'))
+    max_gap = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), default=Decimal('3.00'))
+    min_amp_hours = serializers.IntegerField(min_value=1, required=False)
+    min_cca = serializers.IntegerField(min_value=1, required=False)
+    voltage = serializers.ChoiceField(choices=Battery.VOLTAGE_CHOICES, required=False)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,217 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import detail_cache, equivalents, search, stats, versioning
+from .caching import invalidate_tags
+from .models import (
+    Battery, BatteryImage, Brand, Category, InventoryMovement, Order, OrderItem, Review, VehicleFitment, Wishlist
+)
+from .fuzzy import trigram_index
+from .suggestions import suggestion_index
+
+FITMENT_SOURCE_FIELDS = {'compatible_vehicles', 'vehicle_makes', 'vehicle_models'}
+STATS_SOURCE_FIELDS = ('is_active', 'is_featured', 'is_popular', 'stock_quantity')
+PATCHABLE_INDEXES = [suggestion_index, trigram_index]
+# Stored values compared on save to tell which derived data needs recomputing
+PREVIOUS_FIELDS = tuple(dict.fromkeys([
+    'slug', *STATS_SOURCE_FIELDS, *sorted(FITMENT_SOURCE_FIELDS), *sorted(equivalents.SOURCE_FIELDS),
+]))
+
+
+def patch_indexes(versions, battery, removed=False):
+    for index in PATCHABLE_INDEXES:
+        if removed:
+            index.patch_battery_removed(versions, battery.pk)
+        else:
+            index.patch_battery(versions, battery)
+
+
+def stored_fields(instance, previous, update_fields):
+    """Values of ``PREVIOUS_FIELDS`` now in the row: the instance's where this save wrote them, else the previous ones"""
+    if previous is None or update_fields is None:
+        return {name: getattr(instance, name) for name in PREVIOUS_FIELDS}
+    return {name: getattr(instance, name) if name in update_fields else previous[name] for name in PREVIOUS_FIELDS}
+
+
+def changed_fields(stored, previous):
+    """Fields of ``PREVIOUS_FIELDS`` whose stored value changed; all of them for a new battery"""
+    if previous is None:
+        return set(PREVIOUS_FIELDS)
+    return {name for name in PREVIOUS_FIELDS if stored[name] != previous[name]}
+
+
+def refresh_details(battery_ids):
+    """Refresh the cached detail pages of ``battery_ids`` that still exist"""
+    detail_cache.refresh(Battery.objects.filter(pk__in=battery_ids).values_list('slug', flat=True))
+
+
+@receiver(pre_save, sender=Battery)
+def battery_saving(sender, instance, raw=False, **kwargs):
+    # The stored row is needed for the stats delta and to skip fitment and equivalent
+    # refreshes when their fields did not change; a changed slug must also drop the
+    # page cached under the old one
+    instance._previous = None
+    if not raw and not instance._state.adding:
+        instance._previous = Battery.objects.filter(pk=instance.pk).values(*PREVIOUS_FIELDS).first()
+
+
+@receiver(post_save, sender=Battery)
+def battery_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    stored = stored_fields(instance, previous, update_fields)
+    changed = changed_fields(stored, previous)
+    if FITMENT_SOURCE_FIELDS & changed:
+        VehicleFitment.sync_battery(instance)
+    if equivalents.SOURCE_FIELDS & changed:
+        # Reads the whole voltage group, so keep it out of the writer's transaction
+        transaction.on_commit(lambda: equivalents.refresh_battery(instance.pk))
+    search.index_batteries([instance.pk])
+    versions = versioning.bump('battery')
+    transaction.on_commit(lambda: patch_indexes(versions, instance))
+    new = stats.battery_contribution(*(stored[name] for name in STATS_SOURCE_FIELDS))
+    old = stats.battery_contribution(*(previous[name] for name in STATS_SOURCE_FIELDS)) if previous else {}
+    stats.apply_delta({name: count - old.get(name, 0) for name, count in new.items()})
+    stock_change = stored['stock_quantity'] - (previous['stock_quantity'] if previous else 0)
+    if stock_change:
+        InventoryMovement.objects.create(battery=instance, quantity=stock_change, reason='adjustment' if previous else 'initial')
+    previous_slug = previous['slug'] if previous else instance.slug
+    invalidate_tags('batteries')
+    detail_cache.refresh({instance.slug, previous_slug})
+
+
+@receiver(pre_delete, sender=Battery)
+def battery_deleting(sender, instance, **kwargs):
+    # The delete cascades to the equivalent rows naming this battery, so remember whose lists it was in
+    instance._equivalent_of = list(instance.equivalent_of.values_list('battery_id', flat=True))
+
+
+@receiver(post_delete, sender=Battery)
+def battery_deleted(sender, instance, **kwargs):
+    equivalent_of = getattr(instance, '_equivalent_of', ())
+    transaction.on_commit(lambda: equivalents.refresh_battery(instance.pk, equivalent_of))
+    search.remove_batteries([instance.pk])
+    versions = versioning.bump('battery')
+    transaction.on_commit(lambda: patch_indexes(versions, instance, removed=True))
+    stats.apply_delta({
+        name: -count
+        for name, count in stats.battery_contribution(*(getattr(instance, name) for name in STATS_SOURCE_FIELDS)).items()
+    })
+    invalidate_tags('batteries')
+    detail_cache.refresh([instance.slug])
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        search.index_batteries(instance.batteries.values_list('pk', flat=True))
+        detail_cache.refresh(instance.batteries.values_list('slug', flat=True))
+    if created:
+        stats.apply_delta({'total_brands': 1})
+    versioning.bump('brand')
+    invalidate_tags('brands')
+
+
+@receiver(post_delete, sender=Brand)
+def brand_deleted(sender, instance, **kwargs):
+    # Its batteries were deleted first, which refreshed their pages
+    stats.apply_delta({'total_brands': -1})
+    versioning.bump('brand')
+    invalidate_tags('brands')
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Deleting the category removes its battery links without an m2m_changed signal
+    instance._battery_slugs = list(instance.batteries.values_list('slug', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, signal, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created or signal is post_delete:
+        stats.apply_delta({'total_categories': 1 if created else -1})
+    versioning.bump('category')
+    invalidate_tags('categories')
+    if signal is post_delete:
+        detail_cache.refresh(getattr(instance, '_battery_slugs', ()))
+    elif not created:
+        detail_cache.refresh(instance.batteries.values_list('slug', flat=True))
+
+
+@receiver(m2m_changed, sender=Battery.categories.through)
+def battery_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # A category's links are about to go and post_clear will not say which batteries had them
+        instance._cleared_battery_ids = list(instance.batteries.values_list('pk', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        versioning.bump('category')
+        invalidate_tags('category-links')
+        if not reverse:
+            detail_cache.refresh([instance.slug])
+        else:
+            refresh_details(pk_set if action != 'post_clear' else getattr(instance, '_cleared_battery_ids', ()))
+
+
+@receiver(post_save, sender=BatteryImage)
+@receiver(post_delete, sender=BatteryImage)
+def battery_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    versioning.bump('image')
+    invalidate_tags('battery-images')
+    refresh_details([instance.battery_id])
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, raw=False, **kwargs):
+    # An edit may move the rating or the review to another battery; remember what to take back out
+    instance._previous = None
+    if not raw and not instance._state.adding:
+        instance._previous = Review.objects.filter(pk=instance.pk).values('battery_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Review stats are written with queryset updates, which send no Battery signals
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous != {'battery_id': instance.battery_id, 'rating': instance.rating}:
+        if previous:
+            Battery.objects.filter(pk=previous['battery_id']).adjust_review_stats(previous['rating'], -1)
+            refresh_details([previous['battery_id']])
+        Battery.objects.filter(pk=instance.battery_id).adjust_review_stats(instance.rating, 1)
+    versioning.bump('review')
+    invalidate_tags('reviews')
+    refresh_details([instance.battery_id])
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    Battery.objects.filter(pk=instance.battery_id).adjust_review_stats(instance.rating, -1)
+    versioning.bump('review')
+    invalidate_tags('reviews')
+    refresh_details([instance.battery_id])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_changed(sender, raw=False, **kwargs):
+    if not raw:
+        versioning.bump('order')
+
+
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def wishlist_changed(sender, raw=False, **kwargs):
+    if not raw:
+        versioning.bump('wishlist')
@@ -0,0 +1,135 @@
+"""Columnar in-memory snapshot of active batteries for range filtering.
+
+The numeric and choice columns that most ``BatteryFilter`` traffic touches are
+held as integer arrays (prices in cents, choices as codes), together with one
+precomputed ascending permutation per supported ordering, ties broken by
+primary key as ``StableOrderingFilter`` does in the database. A request is
+answered by masking the columns and walking the permutation, yielding the
+ordered primary keys; only the requested page is then loaded from the database.
+Columns are NumPy arrays when NumPy is installed and ``array`` module arrays
+otherwise. The snapshot is rebuilt when the battery or review catalog version
+moves. Enable it with ``BATTERY_SNAPSHOT_ENABLED``.
+"""
+import math
+import operator
+from array import array
+
+from django.conf import settings
+
+from .models import Battery
+from .versioning import VersionedIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# column -> scale applied before storing the value as an integer
+COLUMNS = {
+    'price': 100,
+    'amp_hours': 1,
+    'cold_cranking_amps': 1,
+    'stock_quantity': 1,
+}
+CODED_COLUMNS = ['voltage', 'condition', 'is_featured', 'is_popular']
+ORDERINGS = ['price', 'created_at', 'name', 'amp_hours', 'cold_cranking_amps', 'average_rating', 'review_count']
+
+# filter parameter -> (column, comparison)
+RANGE_FILTERS = {
+    'min_price': ('price', operator.ge),
+    'max_price': ('price', operator.le),
+    'min_amp_hours': ('amp_hours', operator.ge),
+    'max_amp_hours': ('amp_hours', operator.le),
+    'min_cca': ('cold_cranking_amps', operator.ge),
+    'max_cca': ('cold_cranking_amps', operator.le),
+}
+FILTER_PARAMS = {*RANGE_FILTERS, *CODED_COLUMNS, 'in_stock'}
+
+
+def snapshot_enabled():
+    return getattr(settings, 'BATTERY_SNAPSHOT_ENABLED', False)
+
+
+def bound(value, scale, compare):
+    """Integer bound equivalent to comparing the unscaled column with ``value``"""
+    scaled = value * scale
+    return math.ceil(scaled) if compare is operator.ge else math.floor(scaled)
+
+
+class SnapshotState:
+    def __init__(self, rows):
+        self.ids = [row['pk'] for row in rows]
+        self.codes = {column: {} for column in CODED_COLUMNS}
+        columns = {
+            column: [int(row[column] * scale) for row in rows]
+            for column, scale in COLUMNS.items()
+        }
+        for column in CODED_COLUMNS:
+            codes = self.codes[column]
+            columns[column] = [codes.setdefault(row[column], len(codes)) for row in rows]
+        orderings = {
+            field: sorted(range(len(rows)), key=lambda i: (rows[i][field], rows[i]['pk'].hex))
+            for field in ORDERINGS
+        }
+        if numpy is not None:
+            self.columns = {column: numpy.array(values, dtype=numpy.int64) for column, values in columns.items()}
+            self.orderings = {field: numpy.array(order, dtype=numpy.int64) for field, order in orderings.items()}
+        else:
+            self.columns = {column: array('q', values) for column, values in columns.items()}
+            self.orderings = {field: array('q', order) for field, order in orderings.items()}
+
+    def predicates(self, filters):
+        """(column, comparison, integer value) triples for the cleaned filter values"""
+        predicates = []
+        for param, value in filters.items():
+            if value is None or value == '':
+                continue
+            if param in RANGE_FILTERS:
+                column, compare = RANGE_FILTERS[param]
+                predicates.append((column, compare, bound(value, COLUMNS[column], compare)))
+            elif param == 'in_stock':
+                if value:
+                    predicates.append(('stock_quantity', operator.gt, 0))
+            else:
+                code = self.codes[param].get(value)
+                if code is None:
+                    return None
+                predicates.append((param, operator.eq, code))
+        return predicates
+
+    def matching_ids(self, filters, ordering):
+        """Primary keys of batteries passing ``filters``, ordered by ``ordering`` (``-`` for descending)"""
+        predicates = self.predicates(filters)
+        if predicates is None:
+            return []
+        order = self.orderings[ordering.lstrip('-')]
+        if numpy is not None:
+            mask = numpy.ones(len(self.ids), dtype=bool)
+            for column, compare, value in predicates:
+                mask &= compare(self.columns[column], value)
+            positions = order[mask[order]].tolist()
+        else:
+            positions = order
+            for column, compare, value in predicates:
+                values = self.columns[column]
+                positions = [i for i in positions if compare(values[i], value)]
+        if ordering.startswith('-'):
+            positions = reversed(positions)
+        return [self.ids[i] for i in positions]
+
+
+class CatalogSnapshot(VersionedIndex):
+    version_keys = ('battery', 'review', 'stock')
+
+    def build(self):
+        fields = {*COLUMNS, *CODED_COLUMNS, *ORDERINGS}
+        return SnapshotState(list(Battery.objects.filter(is_active=True).order_by().values('pk', *fields)))
+
+    def supports(self, params, ordering):
+        return set(params) <= FILTER_PARAMS and ordering.lstrip('-') in ORDERINGS
+
+    def matching_ids(self, filters, ordering):
+        return self.current().matching_ids(filters, ordering)
+
+
+catalog_snapshot = CatalogSnapshot()
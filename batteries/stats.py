@@ -0,0 +1,84 @@
+"""Dashboard statistics.
+
+``compute_stats`` counts everything from scratch, with all battery counts in
+one conditional-aggregation query. With ``DASHBOARD_STATS_MATERIALIZED`` the
+counts are instead read from the single ``CatalogStats`` row, which signals
+adjust by each write's delta so reading stays O(1) in the catalog size.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Battery, Brand, CatalogStats, Category
+
+STATS_ROW_PK = 1
+BATTERY_STATS = {
+    'total_batteries': Q(is_active=True),
+    'featured_batteries': Q(is_active=True, is_featured=True),
+    'popular_batteries': Q(is_active=True, is_popular=True),
+    'in_stock_batteries': Q(is_active=True, stock_quantity__gt=0),
+}
+# In the order dashboard_stats has always returned them
+STATS_FIELDS = [
+    'total_batteries', 'featured_batteries', 'popular_batteries',
+    'total_brands', 'total_categories', 'in_stock_batteries',
+]
+
+
+def materialized():
+    return getattr(settings, 'DASHBOARD_STATS_MATERIALIZED', False)
+
+
+def compute_stats():
+    stats = Battery.objects.aggregate(**{name: Count('pk', filter=condition) for name, condition in BATTERY_STATS.items()})
+    stats['total_brands'] = Brand.objects.count()
+    stats['total_categories'] = Category.objects.count()
+    return {name: stats[name] for name in STATS_FIELDS}
+
+
+def battery_contribution(is_active, is_featured, is_popular, stock_quantity):
+    """What one battery with these values adds to each battery counter"""
+    return {
+        'total_batteries': int(is_active),
+        'featured_batteries': int(is_active and is_featured),
+        'popular_batteries': int(is_active and is_popular),
+        'in_stock_batteries': int(is_active and stock_quantity > 0),
+    }
+
+
+def read_stats():
+    if not materialized():
+        return compute_stats()
+    row = CatalogStats.objects.filter(pk=STATS_ROW_PK).values(*STATS_FIELDS).first()
+    if row is None:
+        # Writes that commit between counting and storing would adjust no row and be
+        # lost, so count and store in one transaction; it takes the database write
+        # lock at BEGIN (see DATABASES) and writers wait until the row exists
+        with transaction.atomic():
+            row = CatalogStats.objects.select_for_update().filter(pk=STATS_ROW_PK).values(*STATS_FIELDS).first()
+            if row is None:
+                row = compute_stats()
+                CatalogStats.objects.create(pk=STATS_ROW_PK, **row)
+    return row
+
+
+def apply_delta(delta):
+    """Add ``delta`` to the stats row; a missing row is left for ``read_stats`` to build.
+
+    With materialization off the row is deleted instead, since it would miss
+    this write, so switching the flag back on rebuilds it from scratch.
+    """
+    delta = {name: change for name, change in delta.items() if change}
+    if not delta:
+        return
+    if materialized():
+        CatalogStats.objects.filter(pk=STATS_ROW_PK).update(**{name: F(name) + change for name, change in delta.items()})
+    else:
+        CatalogStats.objects.filter(pk=STATS_ROW_PK).delete()
+
+
+def stats_drift():
+    """{field: (stored, actual)} for every counter the stats row gets wrong"""
+    stored = CatalogStats.objects.filter(pk=STATS_ROW_PK).values(*STATS_FIELDS).first() or {}
+    actual = compute_stats()
+    return {name: (stored.get(name), value) for name, value in actual.items() if stored.get(name) != value}
@@ -0,0 +1,108 @@
+"""In-process prefix index answering ``search_suggestions`` without database queries.
+
+Keys are lower-cased battery and brand names (each from every word start),
+brand-prefixed battery names and model numbers, kept in one
+sorted list so a prefix lookup is a bisect plus a short forward scan. The
+index is rebuilt when the battery or brand catalog version moves and patched
+in place for writes made by this process.
+"""
+from bisect import bisect_left, insort
+
+from .fitment import normalize
+from .models import Battery, Brand
+from .versioning import VersionedIndex
+
+BATTERY_LIMIT = 10
+BRAND_LIMIT = 5
+
+
+def word_suffixes(text):
+    words = normalize(text).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def battery_keys(name, brand_name, model_number):
+    keys = word_suffixes(name)
+    keys.add(normalize(f'{brand_name} {name}'))
+    keys.add(normalize(model_number))
+    keys.discard('')
+    return keys
+
+
+class PrefixIndexState:
+    def __init__(self):
+        self.entries = []  # sorted (key, kind, id)
+        self.keys_by_item = {}
+        self.items = {}
+
+    def add(self, kind, item_id, keys, suggestion):
+        self.remove(kind, item_id)
+        self.items[(kind, item_id)] = suggestion
+        self.keys_by_item[(kind, item_id)] = keys
+        for key in keys:
+            insort(self.entries, (key, kind, item_id))
+
+    def remove(self, kind, item_id):
+        self.items.pop((kind, item_id), None)
+        for key in self.keys_by_item.pop((kind, item_id), ()):
+            position = bisect_left(self.entries, (key, kind, item_id))
+            if position < len(self.entries) and self.entries[position] == (key, kind, item_id):
+                del self.entries[position]
+
+    def add_battery(self, battery_id, name, brand_name, model_number, slug):
+        self.add('battery', battery_id, battery_keys(name, brand_name, model_number),
+                 {'text': f"{brand_name} {name}", 'type': 'battery', 'slug': slug})
+
+    def add_brand(self, brand):
+        self.add('brand', brand.pk, word_suffixes(brand.name),
+                 {'text': brand.name, 'type': 'brand', 'slug': brand.slug})
+
+    def lookup(self, prefix):
+        found = {'battery': [], 'brand': []}
+        limits = {'battery': BATTERY_LIMIT, 'brand': BRAND_LIMIT}
+        seen = set()
+        position = bisect_left(self.entries, (prefix,))
+        while position < len(self.entries):
+            key, kind, item_id = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            if (kind, item_id) not in seen and len(found[kind]) < limits[kind]:
+                seen.add((kind, item_id))
+                found[kind].append(self.items[(kind, item_id)])
+                if all(len(found[k]) >= limits[k] for k in found):
+                    break
+            position += 1
+        return found['battery'] + found['brand']
+
+
+class SuggestionIndex(VersionedIndex):
+    version_keys = ('battery', 'brand')
+
+    def build(self):
+        state = PrefixIndexState()
+        rows = Battery.objects.filter(is_active=True).values_list(
+            'pk', 'name', 'brand__name', 'model_number', 'slug'
+        )
+        for row in rows:
+            state.add_battery(*row)
+        for brand in Brand.objects.all():
+            state.add_brand(brand)
+        return state
+
+    def suggest(self, query):
+        with self.reading() as state:
+            return state.lookup(normalize(query))
+
+    def patch_battery(self, new_versions, battery):
+        def apply(state):
+            if battery.is_active:
+                state.add_battery(battery.pk, battery.name, battery.brand.name, battery.model_number, battery.slug)
+            else:
+                state.remove('battery', battery.pk)
+        self.patch(new_versions, apply)
+
+    def patch_battery_removed(self, new_versions, battery_id):
+        self.patch(new_versions, lambda state: state.remove('battery', battery_id))
+
+
+suggestion_index = SuggestionIndex()
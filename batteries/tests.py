@@ -1,3 +1,1242 @@
-from django.test import TestCase
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+import warnings
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import caching, detail_cache, equivalents, inventory, stats, versioning, warmup
+from .caching import invalidate_tags
+from .dimensions import fit_index
+from .fast_serializers import BatteryRowSerializer, BrandRowSerializer, CategoryRowSerializer, RowSerializer
+from .fitment import parse_fitments, vehicle_q, vehicle_text_q
+from .fuzzy import TrigramIndex, trigram_index
+from .kdtree import KDTree
+from .models import (
+    Battery, BatteryEquivalent, BatteryImage, Brand, CatalogStats, Category, InventoryMovement, Order, OrderItem,
+    Review, VehicleFitment,
+)
+from .renderers import FastJSONRenderer, JSONFragment
+from .snapshot import catalog_snapshot
+from .suggestions import SuggestionIndex, suggestion_index
+from .views import StandardResultsSetPagination
+
+
+def create_catalog(battery_count=8):
+    seller = User.objects.create_user('seller', password='seller-pass')
+    brands = [
+        Brand.objects.create(name='Chloride Exide', country='Kenya', logo='brands/exide.png', is_popular=True),
+        Brand.objects.create(name='Bosch', website='https://bosch.com'),
+    ]
+    cars = Category.objects.create(name='Cars', category_type='vehicle_type', image='categories/cars.png')
+    small_cars = Category.objects.create(name='Small Cars', category_type='vehicle_type', parent_category=cars, display_order=1)
+    Category.objects.create(name='Hatchbacks', category_type='vehicle_type', parent_category=small_cars)
+    Category.objects.create(name='Retired', category_type='vehicle_type', parent_category=cars, is_active=False)
+    agm = Category.objects.create(name='AGM', category_type='battery_type')
+
+    batteries = []
+    for i in range(battery_count):
+        battery = Battery.objects.create(
+            name=f'Power Max {i}', brand=brands[i % 2], model_number=f'NS{40 + i}ZL',
+            voltage='24V' if i % 4 == 3 else '12V', condition='used' if i % 3 == 2 else 'new',
+            amp_hours=35 + i * 5, cold_cranking_amps=300 + i * 40, reserve_capacity=60 + i,
+            length=Decimal('23.5') + i, width=Decimal('17.3'), height=Decimal('20'), weight=Decimal('11.25'),
+            price=Decimal('8999.5') + i * 250, original_price=Decimal('10500') if i % 3 == 0 else None,
+            stock_quantity=i % 4, description=f'Battery {i}', short_description=f'Short {i}',
+            slug=f'power-max-{i}', seller=seller, is_featured=i % 2 == 1, is_popular=i % 3 == 0,
+            is_active=i != battery_count - 1,
+        )
+        battery.categories.add(small_cars if i % 2 else agm)
+        if i % 3 == 0:
+            battery.categories.add(cars)
+        if i % 4:
+            BatteryImage.objects.create(battery=battery, image=f'batteries/{i}-side.jpg', order=0)
+            BatteryImage.objects.create(battery=battery, image=f'batteries/{i}-front.jpg', order=2, is_primary=i % 2 == 0)
+        batteries.append(battery)
+
+    reviewers = [User.objects.create_user(f'reviewer{i}', password='reviewer-pass') for i in range(3)]
+    for i, battery in enumerate(batteries[:4]):
+        for j, reviewer in enumerate(reviewers[:i + 1]):
+            Review.objects.create(battery=battery, user=reviewer, rating=(i + j) % 5 + 1, title='Review', comment='Works')
+    return batteries
+
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+IN_PROCESS_INDEXES = [suggestion_index, trigram_index, fit_index, catalog_snapshot]
+
+
+class FreshCachesMixin:
+    """Starts each test from an empty private cache, unbuilt indexes and unmemoized versions.
+
+    Catalog versions restart with every test database, so anything kept from an
+    earlier test could look current.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        versioning._memo['fetched_at'] = float('-inf')
+        for index in IN_PROCESS_INDEXES:
+            index.invalidate()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTestCase(FreshCachesMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTransactionTestCase(FreshCachesMixin, TransactionTestCase):
+    pass
+
+
+class PrimaryImageTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+
+    def get_list(self, **params):
+        with self.settings(RESPONSE_CACHE_ENABLED=False, BATTERIES_FAST_SERIALIZATION=False):
+            return APIClient().get('/api/batteries/', {'ordering': 'price', **params}).json()['results']
+
+    def test_primary_image_falls_back_to_the_first_image(self):
+        images = {row['slug']: row['primary_image'] for row in self.get_list(page_size=8)}
+        self.assertEqual(images['power-max-1'], 'http://testserver/media/batteries/1-side.jpg')
+        self.assertEqual(images['power-max-2'], 'http://testserver/media/batteries/2-front.jpg')
+        self.assertIsNone(images['power-max-4'])
+
+    def test_list_query_count_does_not_grow_with_the_page(self):
+        query_counts = []
+        for page_size in (2, 7):
+            # Start each request cold, so both pay for the same count and version reads
+            cache.clear()
+            versioning._memo['fetched_at'] = float('-inf')
+            with CaptureQueriesContext(connections['default']) as queries:
+                self.assertEqual(len(self.get_list(page_size=page_size)), page_size)
+            self.assertEqual(len([query for query in queries if 'batteries_batteryimage' in query['sql']]), 1)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class CategoryTreeTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        create_catalog()
+
+    def get_categories(self, **params):
+        # The ETag's version read, then the categories and their battery counts
+        with self.settings(RESPONSE_CACHE_ENABLED=False), self.assertNumQueries(3):
+            response = APIClient().get('/api/categories/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_tree_takes_two_queries_at_any_depth(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), self.settings(BATTERIES_FAST_SERIALIZATION=fast):
+                [agm, cars] = self.get_categories()['results']
+                self.assertEqual((agm['name'], agm['battery_count']), ('AGM', 4))
+                self.assertEqual((cars['name'], cars['battery_count']), ('Cars', 3))
+                [small_cars] = cars['subcategories']
+                self.assertEqual((small_cars['battery_count'], len(small_cars['subcategories'])), (3, 1))
+
+    def test_filters(self):
+        cars = Category.objects.get(name='Cars')
+        by_type = self.get_categories(type='vehicle_type')['results']
+        self.assertEqual([c['name'] for c in by_type], ['Cars', 'Hatchbacks', 'Small Cars'])
+        children = self.get_categories(parent=str(cars.pk))['results']
+        self.assertEqual([c['name'] for c in children], ['Small Cars'])
+
+
+class ExpandedEmbedsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        create_catalog()
+
+    def get(self, path, **params):
+        with self.settings(RESPONSE_CACHE_ENABLED=False):
+            response = APIClient().get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_embeds_are_compact_by_default(self):
+        for path in ('/api/batteries/', '/api/batteries/power-max-0/'):
+            with self.subTest(path=path):
+                data = self.get(path)
+                battery = data['results'][0] if 'results' in data else data
+                self.assertEqual(set(battery['brand']), {'id', 'name', 'slug'})
+                self.assertEqual(set(battery['categories'][0]), {'id', 'name', 'category_type'})
+
+    def test_expand_returns_the_full_serializers(self):
+        for path in ('/api/batteries/', '/api/batteries/power-max-0/'):
+            with self.subTest(path=path):
+                data = self.get(path, expand='brand,categories', ordering='price')
+                battery = data['results'][0] if 'results' in data else data
+                self.assertEqual(battery['brand']['name'], 'Chloride Exide')
+                self.assertEqual(battery['brand']['battery_count'], 4)
+                self.assertIn('website', battery['brand'])
+                by_name = {category['name']: category for category in battery['categories']}
+                self.assertEqual(set(by_name), {'AGM', 'Cars'})
+                self.assertEqual(by_name['Cars']['battery_count'], 3)
+                self.assertEqual([c['name'] for c in by_name['Cars']['subcategories']], ['Small Cars'])
+
+
+class FastSerializationParityTests(CatalogTestCase):
+    """The row serializers must render byte-identical responses to the DRF serializers"""
+
+    requests = [
+        ('/api/batteries/', {}),
+        ('/api/batteries/', {'ordering': 'price'}),
+        ('/api/batteries/', {'ordering': '-average_rating', 'page_size': 3, 'page': 2}),
+        ('/api/batteries/', {'voltage': '12V', 'in_stock': 'true'}),
+        ('/api/batteries/', {'search': 'Bosch'}),
+        ('/api/batteries/', {'category_type': 'vehicle_type'}),
+        ('/api/batteries/featured/', {}),
+        ('/api/batteries/popular/', {}),
+        ('/api/brands/', {}),
+        ('/api/categories/', {}),
+        ('/api/categories/', {'type': 'vehicle_type'}),
+        ('/api/categories/', {'parent': ''}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog()
+
+    def render(self, path, params, fast):
+        with override_settings(BATTERIES_FAST_SERIALIZATION=fast, RESPONSE_CACHE_ENABLED=False):
+            response = APIClient().get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_responses_are_byte_identical(self):
+        for path, params in self.requests:
+            with self.subTest(path=path, params=params):
+                self.assertEqual(self.render(path, params, fast=True), self.render(path, params, fast=False))
+
+    def test_parent_filter_is_byte_identical(self):
+        cars = Category.objects.get(name='Cars')
+        params = {'parent': str(cars.pk)}
+        self.assertEqual(
+            self.render('/api/categories/', params, fast=True),
+            self.render('/api/categories/', params, fast=False),
+        )
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """FastJSONRenderer renders what JSONRenderer does and splices fragments in verbatim"""
+
+    def render_both(self, data):
+        return FastJSONRenderer().render(data), JSONRenderer().render(data)
+
+    def test_matches_json_renderer(self):
+        data = {
+            'decimal': Decimal('8999.50'),
+            'datetime': datetime.datetime(2026, 10, 17, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'date': datetime.date(2026, 10, 17),
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'keys': {1: 'int', False: 'bool', None: 'none'},
+            'text': 'Nairobi \u2028 ✓',
+            'nested': [[1, 2.5], {'a': None}],
+        }
+        fast, drf = self.render_both(data)
+        self.assertEqual(fast, drf)
+
+    def test_floats_have_the_same_values(self):
+        for value in [0.1, -0.0, 123456789.123, 1e16, 1e-7, 1.5e300]:
+            with self.subTest(value=value):
+                fast, drf = self.render_both({'value': value})
+                self.assertEqual(json.loads(fast), json.loads(drf))
+
+    def test_big_integers_fall_back_to_stdlib(self):
+        data = {'big': 2 ** 64, 'negative': -(2 ** 70), 'fragment': JSONFragment('[1]')}
+        self.assertEqual(FastJSONRenderer().render(data), b'{"big":18446744073709551616,"negative":-1180591620717411303424,"fragment":[1]}')
+
+    def test_fragments_are_spliced(self):
+        data = {'a': JSONFragment('{"x":1}'), 'b': [JSONFragment(b'[1,2]'), 'plain'], 'c': {'d': JSONFragment('"s"')}}
+        expected = b'{"a":{"x":1},"b":[[1,2],"plain"],"c":{"d":"s"}}'
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        # The standard library path, taken for indented output
+        indented = FastJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(json.loads(indented), json.loads(expected))
+        self.assertEqual(FastJSONRenderer().render(JSONFragment('{"whole":true}')), b'{"whole":true}')
+
+
+class ReviewStatsTests(CatalogTestCase):
+    """Stored review statistics follow review writes and survive stale battery saves"""
+
+    def setUp(self):
+        super().setUp()
+        self.battery, self.other = create_catalog(battery_count=6)[4:6]
+        self.users = [User.objects.create_user(f'critic{i}', password='critic-pass') for i in range(3)]
+
+    def stats(self, battery):
+        battery.refresh_from_db()
+        return {name: getattr(battery, name) for name in Battery.REVIEW_STATS_FIELDS}
+
+    def recounted(self, battery):
+        Battery.objects.filter(pk=battery.pk).refresh_review_stats()
+        return self.stats(battery)
+
+    def test_review_writes_update_stats(self):
+        reviews = [
+            Review.objects.create(battery=self.battery, user=user, rating=rating, title='Review', comment='Works')
+            for user, rating in zip(self.users, [5, 4, 4])
+        ]
+        self.assertEqual(self.stats(self.battery)['review_count'], 3)
+        self.assertEqual(self.battery.rating_histogram, {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1})
+        self.assertAlmostEqual(self.battery.average_rating, 13 / 3)
+
+        reviews[0].rating = 1
+        reviews[0].save()
+        self.assertEqual(self.stats(self.battery)['rating_sum'], 9)
+        self.assertEqual(self.battery.rating_histogram, {'1': 1, '2': 0, '3': 0, '4': 2, '5': 0})
+
+        reviews[1].battery = self.other
+        reviews[1].save()
+        reviews[2].delete()
+        self.assertEqual(self.stats(self.battery), self.recounted(self.battery))
+        self.assertEqual(self.stats(self.other), self.recounted(self.other))
+        self.assertEqual((self.battery.review_count, self.other.review_count), (1, 1))
+
+    def test_stale_battery_save_keeps_stats(self):
+        stale = Battery.objects.get(pk=self.battery.pk)
+        Review.objects.create(battery=self.battery, user=self.users[0], rating=2, title='Review', comment='Meh')
+        stale.description = 'Edited'
+        stale.save()
+        self.assertEqual(self.stats(self.battery)['review_count'], 1)
+        self.assertEqual(self.battery.rating_2_count, 1)
+
+    def test_save_of_a_deleted_battery_writes_it_back(self):
+        loaded = Battery.objects.get(pk=self.battery.pk)
+        Battery.objects.filter(pk=self.battery.pk).delete()
+        loaded.description = 'Restored'
+        loaded.save()
+        self.assertEqual(Battery.objects.get(pk=self.battery.pk).description, 'Restored')
+
+    def test_forced_insert_writes_every_field(self):
+        Review.objects.create(battery=self.battery, user=self.users[0], rating=4, title='Review', comment='Good')
+        copy = Battery.objects.get(pk=self.battery.pk)
+        copy.pk, copy.slug, copy.model_number = uuid.uuid4(), 'power-max-copy', 'COPY1'
+        copy.save(force_insert=True)
+        self.assertEqual(self.stats(copy), self.stats(self.battery))
+        self.assertEqual(copy.stock_quantity, self.battery.stock_quantity)
+
+    def test_rating_histogram_endpoint(self):
+        client = APIClient()
+        for user, rating in zip(self.users, [3, 5, 5]):
+            client.force_authenticate(user)
+            response = client.post('/api/reviews/create/', {
+                'battery': str(self.battery.pk), 'rating': rating, 'title': 'Review', 'comment': 'Good',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        response = APIClient().get(f'/api/batteries/{self.battery.pk}/rating-histogram/')
+        self.assertEqual(response.json(), {
+            'average_rating': 4.3, 'review_count': 3, 'histogram': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 2},
+        })
+
+class FitmentTests(CatalogTestCase):
+    """Compatibility lists are parsed into fitment rows that vehicle searches match"""
+
+    def setUp(self):
+        super().setUp()
+        self.battery = create_catalog(battery_count=2)[0]
+        self.battery.compatible_vehicles = ['Toyota Land Cruiser Prado 3.0 D-4D 2003-2009', 'Honda Fit 2008-present']
+        self.battery.vehicle_makes = ['Toyota', 'Honda', 'Nissan']
+        self.battery.vehicle_models = ['Vitz']
+        self.battery.save()
+
+    def matches(self, condition):
+        return set(VehicleFitment.objects.filter(condition).values_list('make', 'model'))
+
+    def test_parse_fitments(self):
+        rows = parse_fitments(self.battery.compatible_vehicles, self.battery.vehicle_makes, self.battery.vehicle_models)
+        self.assertEqual(
+            [(row['make'], row['model'], row['year_from'], row['year_to'], row['engine']) for row in rows],
+            [
+                ('Toyota', 'Land Cruiser Prado', 2003, 2009, '3.0 D-4D'),
+                ('Honda', 'Fit', 2008, None, ''),
+                ('Nissan', '', None, None, ''),
+                ('', 'Vitz', None, None, ''),
+            ],
+        )
+
+    def test_save_replaces_fitments(self):
+        self.assertEqual(self.battery.fitments.count(), 4)
+        self.battery.compatible_vehicles = []
+        self.battery.vehicle_models = []
+        self.battery.save()
+        self.assertEqual(self.matches(Q(battery=self.battery)), {('Toyota', ''), ('Honda', ''), ('Nissan', '')})
+
+    def test_vehicle_search(self):
+        self.assertEqual(self.matches(vehicle_text_q('land cruiser')), {('Toyota', 'Land Cruiser Prado')})
+        self.assertEqual(self.matches(vehicle_text_q('Toyota Land Cruiser 2012')), set())
+        self.assertEqual(self.matches(vehicle_text_q('fit 2015')), {('Honda', 'Fit')})
+        self.assertEqual(self.matches(vehicle_q(make='honda', model='fi')), set())
+        self.assertEqual(self.matches(vehicle_q(make='Nissan', year=1999)), {('Nissan', '')})
+
+    def test_year_alone_skips_undated_fitments(self):
+        self.assertEqual(self.matches(vehicle_text_q('2005')), {('Toyota', 'Land Cruiser Prado')})
+        self.assertEqual(self.matches(vehicle_q(year=2010)), {('Honda', 'Fit')})
+        self.assertEqual(self.matches(vehicle_q(year=1999)), set())
+
+
+class FullTextSearchTests(CatalogTestCase):
+    """?search= matches in SQL: ranked by bm25, uncapped, and infix on model numbers"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+        self.batteries[1].description = 'Sealed marine battery'
+        self.batteries[1].save()
+        self.batteries[2].name = 'Marine Starter'
+        self.batteries[2].save()
+
+    def search(self, text, **params):
+        response = APIClient().get('/api/batteries/', {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def slugs(self, data):
+        return [row['slug'] for row in data['results']]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.slugs(self.search('marine')), ['power-max-2', 'power-max-1'])
+        self.assertEqual(self.slugs(self.search('marine', ordering='-price')), ['power-max-2', 'power-max-1'])
+        self.assertEqual(self.slugs(self.search('marine', ordering='price')), ['power-max-1', 'power-max-2'])
+
+    def test_counts_and_pages_every_match(self):
+        data = self.search('power', page_size=5)
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(len(self.search('power', page_size=5, page=2)['results']), 1)
+
+    def test_model_number_infix(self):
+        self.assertEqual(self.slugs(self.search('40zl')), ['power-max-0'])
+        self.assertEqual(self.search('ZL')['count'], 7)
+        self.assertEqual(self.slugs(self.search('bosch 43ZL')), ['power-max-3'])
+        self.assertEqual(self.search('bosch 40ZL')['count'], 0)
+
+    def test_facets_follow_search(self):
+        response = APIClient().get('/api/batteries/facets/', {'search': 'marine'})
+        self.assertEqual(response.json()['count'], 2)
+
+class SuggestionIndexTests(CatalogTestCase):
+    """The prefix index follows battery writes and never patches under a reader"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog(battery_count=3)
+        self.index = SuggestionIndex()
+
+    def test_follows_battery_writes(self):
+        self.assertEqual([s['slug'] for s in self.index.suggest('ns41')], ['power-max-1'])
+        versions = versioning.bump('battery')
+        self.index.patch(versions, lambda state: state.add_battery(
+            self.batteries[1].pk, 'Ultra Start', 'Bosch', 'NS41ZL', 'power-max-1',
+        ))
+        self.assertEqual([s['text'] for s in self.index.suggest('ultra')], ['Bosch Ultra Start'])
+        self.assertEqual(self.index.suggest('power max 1'), [])
+
+    def test_patch_waits_for_readers(self):
+        patched = threading.Event()
+        versions = {key: version + 1 for key, version in versioning.get_versions(('battery',), 0).items()}
+        with self.index.reading() as state:
+            writer = threading.Thread(target=self.index.patch, args=(versions, lambda state: patched.set()))
+            writer.start()
+            self.assertFalse(patched.wait(0.2))
+            state.lookup('power')
+        writer.join()
+        self.assertTrue(patched.is_set())
+
+    def test_invalidation_after_a_read_keeps_its_state(self):
+        index = self.index
+
+        class InvalidatingLock:
+            """Lets another thread invalidate the index the moment the lock is released"""
+            lock = threading.RLock()
+            fired = False
+
+            def __enter__(self):
+                self.lock.acquire()
+
+            def __exit__(self, *exc_info):
+                self.lock.release()
+                if not InvalidatingLock.fired:
+                    InvalidatingLock.fired = True
+                    index.invalidate()
+
+        index.lock = InvalidatingLock()
+        self.assertIsNotNone(index.current())
+        self.assertEqual([s['slug'] for s in index.suggest('ns41')], ['power-max-1'])
+
+class TrigramIndexTests(CatalogTestCase):
+    """Fuzzy matching tolerates spacing and typos and follows battery writes"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog(battery_count=3)
+        self.index = TrigramIndex()
+
+    def test_match(self):
+        self.assertEqual(self.index.match('ns40 zl')[0], (self.batteries[0].pk, 1.0))
+        self.assertEqual([s['slug'] for s in self.index.suggestions('NS-41ZL', 1)], ['power-max-1'])
+        self.assertEqual(self.index.match('xyz'), [])
+
+    def test_patch_removes_battery_under_lock(self):
+        with self.index.reading():
+            versions = versioning.bump('battery')
+            writer = threading.Thread(target=self.index.patch_battery_removed, args=(versions, self.batteries[0].pk))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+        writer.join()
+        self.assertNotIn(self.batteries[0].pk, dict(self.index.match('ns40zl')))
+
+    def test_list_ranks_and_pages_every_match(self):
+        trigram_index.invalidate()
+        client = APIClient()
+        data = client.get('/api/batteries/', {'fuzzy': 'ns41zl', 'page_size': 1}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([row['slug'] for row in data['results']], ['power-max-1'])
+        data = client.get('/api/batteries/', {'fuzzy': 'ns41zl', 'page_size': 1, 'page': 2}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['power-max-0'])
+        # Other filters and an explicit ordering still apply
+        data = client.get('/api/batteries/', {'fuzzy': 'ns41zl', 'ordering': 'price'}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['power-max-0', 'power-max-1'])
+        data = client.get('/api/batteries/', {'fuzzy': 'ns41zl', 'max_price': '9000'}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['power-max-0'])
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class SnapshotParityTests(CatalogTestCase):
+    """Lists answered from the catalog snapshot must match the queryset path, ties included"""
+
+    requests = [
+        {'min_price': '9000'},
+        {'max_price': '10000.25', 'ordering': '-price'},
+        {'min_amp_hours': '40', 'voltage': '12V', 'ordering': 'review_count'},
+        {'in_stock': 'true', 'ordering': '-review_count'},
+        {'condition': 'new', 'ordering': 'average_rating', 'page_size': 2, 'page': 2},
+        {'max_cca': '500', 'ordering': '-average_rating'},
+        {'min_cca': '350', 'is_featured': 'true', 'ordering': 'name'},
+        {'voltage': '6V'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(battery_count=12)
+
+    def render(self, params, snapshot):
+        with override_settings(BATTERY_SNAPSHOT_ENABLED=snapshot):
+            response = APIClient().get('/api/batteries/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_snapshot_matches_queryset(self):
+        for params in self.requests:
+            with self.subTest(params=params):
+                self.assertEqual(self.render(params, snapshot=True), self.render(params, snapshot=False))
+
+    def test_snapshot_answers_supported_requests(self):
+        with mock.patch.object(catalog_snapshot, 'matching_ids', wraps=catalog_snapshot.matching_ids) as matching_ids:
+            self.render({'min_price': '9000', 'ordering': 'review_count'}, snapshot=True)
+            self.render({'search': 'power'}, snapshot=True)
+        self.assertEqual(matching_ids.call_count, 1)
+
+class KDTreeTests(SimpleTestCase):
+    """k-d tree queries agree with a brute-force scan"""
+
+    def setUp(self):
+        super().setUp()
+        generator = random.Random(7)
+        self.points = [tuple(generator.randint(0, 20) for _ in range(3)) for _ in range(300)]
+        self.tree = KDTree(self.points, list(range(len(self.points))))
+        self.targets = [tuple(generator.uniform(-2, 22) for _ in range(3)) for _ in range(25)]
+
+    def test_range_search(self):
+        for low, high in [((2, 5, 0), (8, 9, 20)), ((0, 0, 0), (20, 20, 20)), ((15, 15, 15), (14, 20, 20))]:
+            expected = {i for i, point in enumerate(self.points) if all(l <= p <= h for l, p, h in zip(low, point, high))}
+            self.assertEqual({payload for _, payload in self.tree.range_search(low, high)}, expected)
+
+    def test_nearest(self):
+        for target in self.targets:
+            distances = sorted(sum((a - b) ** 2 for a, b in zip(point, target)) for point in self.points)
+            found = self.tree.nearest(target, 5)
+            self.assertEqual([distance for distance, _ in found], distances[:5])
+            for distance, payload in found:
+                self.assertEqual(distance, sum((a - b) ** 2 for a, b in zip(self.points[payload], target)))
+
+    def test_nearest_excludes_payload(self):
+        found = self.tree.nearest(self.points[0], len(self.points), exclude=0)
+        self.assertEqual(len(found), len(self.points) - 1)
+        self.assertNotIn(0, [payload for _, payload in found])
+
+    def test_empty_tree(self):
+        self.assertEqual(len(KDTree([], [])), 0)
+
+
+class BatteryFitTests(CatalogTestCase):
+    """Tray-fit search ranks the snuggest batteries first and pages over every fit"""
+
+    tray = {'length': '23.7', 'width': '17.3', 'height': '20', 'tolerance': '1', 'max_gap': '2'}
+
+    def setUp(self):
+        super().setUp()
+        create_catalog()
+
+    def fit(self, **params):
+        response = APIClient().get('/api/batteries/fit/', {**self.tray, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['slug'] for row in response.json()['results']]
+
+    def test_snuggest_first(self):
+        self.assertEqual(self.fit(), ['power-max-0', 'power-max-1'])
+        self.assertEqual(self.fit(tolerance='3'), ['power-max-0', 'power-max-1', 'power-max-2', 'power-max-3'])
+        self.assertEqual(self.fit(min_cca='340'), ['power-max-1'])
+
+    def test_voltage_filter(self):
+        self.assertEqual(self.fit(voltage='24V', tolerance='3'), ['power-max-3'])
+        self.assertEqual(self.fit(voltage='24V'), [])
+
+    def test_counts_and_pages_every_fit(self):
+        response = APIClient().get('/api/batteries/fit/', {**self.tray, 'tolerance': '3', 'page_size': 3, 'page': 2})
+        self.assertEqual(response.json()['count'], 4)
+        self.assertEqual([row['slug'] for row in response.json()['results']], ['power-max-3'])
+
+class DerivedDataRefreshTests(CatalogTestCase):
+    """Saving a battery recomputes fitments and equivalents only when their source fields change"""
+
+    def setUp(self):
+        super().setUp()
+        self.battery = create_catalog(battery_count=4)[0]
+        self.refresh = mock.patch('batteries.signals.equivalents.refresh_battery').start()
+        self.sync = mock.patch.object(VehicleFitment, 'sync_battery').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_price_edit_touches_neither(self):
+        equivalents_before = list(BatteryEquivalent.objects.filter(battery=self.battery).values_list('equivalent', 'rank'))
+        self.battery.price = Decimal('7999.00')
+        self.battery.length = Decimal('23.50')
+        self.battery.save()
+        self.refresh.assert_not_called()
+        self.sync.assert_not_called()
+        self.assertEqual(
+            list(BatteryEquivalent.objects.filter(battery=self.battery).values_list('equivalent', 'rank')), equivalents_before,
+        )
+
+    def test_spec_edit_refreshes_equivalents_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.battery.amp_hours = 90
+            self.battery.save()
+            self.refresh.assert_not_called()
+        self.refresh.assert_called_once_with(self.battery.pk)
+        self.sync.assert_not_called()
+
+    def test_vehicle_edit_syncs_fitments(self):
+        self.battery.vehicle_makes = ['Mazda']
+        self.battery.save()
+        self.sync.assert_called_once_with(self.battery)
+        self.refresh.assert_not_called()
+
+    def test_fields_left_out_of_update_fields_are_ignored(self):
+        self.battery.amp_hours = 90
+        self.battery.save(update_fields=['price'])
+        self.refresh.assert_not_called()
+
+class EquivalentsTests(CatalogTestCase):
+    """Equivalents are the nearest batteries of the same voltage, closest first"""
+
+    def setUp(self):
+        super().setUp()
+        # Specs grow with the index, so spec distance follows the distance between indexes
+        self.batteries = create_catalog()
+        self.stored_pairs = equivalents.compute_equivalents()
+
+    def listed(self, battery):
+        return list(BatteryEquivalent.objects.filter(battery=battery).order_by('rank').values_list('equivalent', flat=True))
+
+    def test_nearest_same_voltage_first(self):
+        # 12V: 0, 1, 2, 4, 5, 6; 24V: 3 alone (7 is inactive)
+        self.assertEqual(self.stored_pairs, 30)
+        by_index = {battery.pk: index for index, battery in enumerate(self.batteries)}
+        self.assertEqual([by_index[pk] for pk in self.listed(self.batteries[0])], [1, 2, 4, 5, 6])
+        self.assertEqual([by_index[pk] for pk in self.listed(self.batteries[6])], [5, 4, 2, 1, 0])
+        self.assertEqual(self.listed(self.batteries[3]), [])
+
+    def test_distances_are_symmetric_and_ranked(self):
+        rows = {(row.battery_id, row.equivalent_id): row for row in BatteryEquivalent.objects.all()}
+        for (battery_id, equivalent_id), row in rows.items():
+            self.assertAlmostEqual(rows[equivalent_id, battery_id].distance, row.distance)
+        for battery in self.batteries:
+            distances = list(BatteryEquivalent.objects.filter(battery=battery).order_by('rank').values_list('distance', flat=True))
+            self.assertEqual(distances, sorted(distances))
+
+    def test_refresh_matches_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batteries[6].amp_hours = 30
+            self.batteries[6].cold_cranking_amps = 290
+            self.batteries[6].reserve_capacity = 59
+            self.batteries[6].length = Decimal('22.5')
+            self.batteries[6].save()
+        incremental = self.listed(self.batteries[0])
+        equivalents.compute_equivalents()
+        self.assertEqual(self.listed(self.batteries[0]), incremental)
+        self.assertEqual(incremental[0], self.batteries[6].pk)
+
+    def test_endpoint(self):
+        response = APIClient().get(f'/api/batteries/{self.batteries[0].pk}/equivalents/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['slug'] for row in response.json()], ['power-max-1', 'power-max-2', 'power-max-4', 'power-max-5', 'power-max-6'])
+        self.assertEqual(APIClient().get(f'/api/batteries/{self.batteries[7].pk}/equivalents/').status_code, 404)
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class KeysetPaginationTests(CatalogTestCase):
+    """Cursor pages cover every row once, in order, and step back to the same pages"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog(battery_count=9)
+        self.client = APIClient()
+
+    def walk(self, url, params=None):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append(data)
+            if not data['next']:
+                return pages
+            response = self.client.get(data['next'])
+
+    def slugs(self, pages):
+        return [row['slug'] for page in pages for row in page['results']]
+
+    def test_walks_every_row_in_order(self):
+        pages = self.walk('/api/batteries/', {'pagination': 'cursor', 'page_size': 3, 'ordering': '-price'})
+        self.assertEqual(self.slugs(pages), [f'power-max-{i}' for i in range(7, -1, -1)])
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 2])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+
+    def test_ties_are_neither_repeated_nor_skipped(self):
+        for ordering in ['review_count', '-average_rating']:
+            with self.subTest(ordering=ordering):
+                pages = self.walk('/api/batteries/', {'pagination': 'cursor', 'page_size': 2, 'ordering': ordering})
+                slugs = self.slugs(pages)
+                unpaged = self.client.get('/api/batteries/', {'ordering': ordering, 'page_size': 50}).json()['results']
+                self.assertEqual(slugs, [row['slug'] for row in unpaged])
+
+    def test_previous_returns_the_same_page(self):
+        pages = self.walk('/api/batteries/', {'pagination': 'cursor', 'page_size': 3})
+        for page, previous in zip(pages[1:], pages):
+            data = self.client.get(page['previous']).json()
+            self.assertEqual(data['results'], previous['results'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/batteries/', {'cursor': 'bm9wZQ'}).status_code, 404)
+
+    def test_review_list(self):
+        battery = self.batteries[3]
+        pages = self.walk(f'/api/batteries/{battery.pk}/reviews/', {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual([len(page['results']) for page in pages], [2, 1])
+        self.assertEqual(
+            sorted(row['id'] for page in pages for row in page['results']),
+            sorted(battery.reviews.values_list('pk', flat=True)),
+        )
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class CachedCountTests(CatalogTestCase):
+    """Page counts are cached per filter set until a catalog version they depend on moves"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog(battery_count=9)
+        self.client = APIClient()
+
+    def page(self, **params):
+        response = self.client.get('/api/batteries/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_count_is_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.page(voltage='12V')['count'], 6)
+        # Queryset updates send no signals, so the cached count stays until a version bump
+        Battery.objects.filter(pk=self.batteries[0].pk).update(is_active=False)
+        self.assertEqual(self.page(voltage='12V', page=1, ordering='price')['count'], 6)
+        self.assertEqual(self.page(voltage='24V')['count'], 2)
+        versioning.bump('battery')
+        self.assertEqual(self.page(voltage='12V')['count'], 5)
+
+    def test_save_invalidates_count(self):
+        self.assertEqual(self.page()['count'], 8)
+        self.batteries[1].is_active = False
+        self.batteries[1].save()
+        self.assertEqual(self.page()['count'], 7)
+
+    @mock.patch.object(StandardResultsSetPagination, 'count_estimate_threshold', 3)
+    def test_estimated_count(self):
+        # Every count key is hashed, so memcached would accept it too
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            data = self.page(count='estimated')
+        self.assertEqual((data['count'], data['count_exact']), (8, False))
+        data = self.page(count='estimated', voltage='24V')
+        self.assertEqual((data['count'], data['count_exact']), (2, True))
+        data = self.page()
+        self.assertEqual((data['count'], data['count_exact']), (8, True))
+
+class ResponseCacheTests(CatalogTestCase):
+    """Anonymous responses are served from the cache until one of their tags is invalidated"""
+
+    def setUp(self):
+        super().setUp()
+        create_catalog(battery_count=2)
+        self.brand = Brand.objects.get(name='Bosch')
+        self.client = APIClient()
+
+    def brand_names(self, client=None):
+        response = (client or self.client).get('/api/brands/')
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.json()['results']}
+
+    def rename_quietly(self, name):
+        # Queryset updates send no signals, so only an explicit invalidation reaches the cache
+        Brand.objects.filter(pk=self.brand.pk).update(name=name)
+
+    def test_internal_requests_go_through_middleware(self):
+        response = caching.internal_get('http://testserver', '/api/brands/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            self.assertEqual(caching.internal_get('http://attacker.example', '/api/brands/').status_code, 400)
+
+    def test_served_until_tag_invalidated(self):
+        before = self.brand_names()
+        self.rename_quietly('Varta')
+        self.assertEqual(self.brand_names(), before)
+        invalidate_tags('reviews')
+        self.assertEqual(self.brand_names(), before)
+        invalidate_tags('brands')
+        self.assertIn('Varta', self.brand_names())
+
+    def test_save_invalidates(self):
+        self.brand_names()
+        self.brand.name = 'Varta'
+        self.brand.save()
+        self.assertIn('Varta', self.brand_names())
+
+    def test_commit_invalidates_again(self):
+        # A read racing the write sees the old rows after the first invalidation
+        # and caches them under the new tag version; the on-commit pass retires them
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_tags('brands')
+            before = self.brand_names()
+            self.rename_quietly('Varta')
+            self.assertEqual(self.brand_names(), before)
+        self.assertIn('Varta', self.brand_names())
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.brand_names()
+        self.rename_quietly('Varta')
+        client = APIClient()
+        client.force_login(User.objects.get(username='seller'))
+        self.assertIn('Varta', self.brand_names(client))
+
+class StaleResponseETagTests(CatalogTransactionTestCase):
+    """A stale response goes out under the ETag of the body it carries, not the current one"""
+
+    def setUp(self):
+        super().setUp()
+        self.battery = create_catalog(battery_count=4)[1]
+        self.client = APIClient()
+
+    def get(self, etag=None):
+        return self.client.get('/api/batteries/featured/', **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+
+    def names(self, response):
+        return [row['name'] for row in response.json()['results']]
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 10
+        while True:
+            response = self.get()
+            if self.names(response) == ['Renamed'] or time.monotonic() > deadline:
+                return response
+            time.sleep(0.05)
+
+    def test_write_stale_get_conditional_get(self):
+        first = self.get()
+        self.assertEqual(self.names(first), ['Power Max 1'])
+        self.battery.name = 'Renamed'
+        self.battery.save()
+
+        with mock.patch('batteries.caching.refresh_in_background') as refresh:
+            stale = self.get()
+            self.assertEqual((self.names(stale), stale['ETag']), (['Power Max 1'], first['ETag']))
+            # The client's copy is exactly what would be served
+            self.assertEqual(self.get(first['ETag']).status_code, 304)
+        caching.release(refresh.call_args.args[0])
+
+        fresh = self.wait_for_refresh()
+        self.assertEqual(self.names(fresh), ['Renamed'])
+        self.assertNotEqual(fresh['ETag'], first['ETag'])
+        response = self.get(first['ETag'])
+        self.assertEqual((response.status_code, self.names(response)), (200, ['Renamed']))
+        self.assertEqual(self.get(fresh['ETag']).status_code, 304)
+
+    def test_detail_page_keeps_its_etag(self):
+        path = f'/api/batteries/{self.battery.slug}/'
+        first = self.client.get(path)
+        # Advance the versions without touching the cached page
+        versioning.bump('battery')
+        cached = self.client.get(path)
+        self.assertEqual((cached.content, cached['ETag']), (first.content, first['ETag']))
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+class DashboardStatsTests(CatalogTestCase):
+    """The materialized stats row follows writes and is rebuilt after writes made with it off"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+
+    @override_settings(DASHBOARD_STATS_MATERIALIZED=True)
+    def test_row_follows_writes(self):
+        self.assertEqual(stats.read_stats(), stats.compute_stats())
+        self.batteries[0].is_featured = True
+        self.batteries[0].stock_quantity = 0
+        self.batteries[0].save()
+        self.batteries[1].delete()
+        Brand.objects.create(name='Varta')
+        Category.objects.get(name='Retired').delete()
+        self.assertEqual(stats.stats_drift(), {})
+        self.assertEqual(stats.read_stats(), stats.compute_stats())
+
+    def test_writes_with_flag_off_drop_the_row(self):
+        with override_settings(DASHBOARD_STATS_MATERIALIZED=True):
+            stats.read_stats()
+        self.batteries[2].is_active = False
+        self.batteries[2].save()
+        self.assertFalse(CatalogStats.objects.exists())
+        with override_settings(DASHBOARD_STATS_MATERIALIZED=True):
+            self.assertEqual(stats.read_stats()['total_batteries'], 6)
+            self.assertEqual(stats.stats_drift(), {})
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_endpoint_same_either_way(self):
+        computed = APIClient().get('/api/dashboard/stats/').json()
+        with override_settings(DASHBOARD_STATS_MATERIALIZED=True):
+            self.assertEqual(APIClient().get('/api/dashboard/stats/').json(), computed)
+        self.assertEqual(list(computed), stats.STATS_FIELDS)
+
+class StatsRebuildTests(CatalogTransactionTestCase):
+    """A write committed while the stats row is being rebuilt is not lost"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+
+    @override_settings(DASHBOARD_STATS_MATERIALIZED=True)
+    def test_write_during_rebuild(self):
+        counted = threading.Event()
+        compute_stats = stats.compute_stats
+
+        def slow_compute():
+            row = compute_stats()
+            counted.set()
+            time.sleep(0.5)
+            return row
+
+        def rebuild():
+            try:
+                stats.read_stats()
+            finally:
+                connections.close_all()
+
+        def feature():
+            counted.wait()
+            try:
+                battery = Battery.objects.get(pk=self.batteries[0].pk)
+                battery.is_featured = True
+                battery.save()
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(stats, 'compute_stats', slow_compute):
+            threads = [threading.Thread(target=rebuild), threading.Thread(target=feature)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(stats.stats_drift(), {})
+
+class DetailCacheTests(CatalogTransactionTestCase):
+    """Detail pages are invalidated at write and commit, then re-rendered off the writer's thread"""
+
+    def setUp(self):
+        super().setUp()
+        self.battery = create_catalog(battery_count=2)[0]
+        self.path = f'/api/batteries/{self.battery.slug}/'
+        self.client = APIClient()
+        self.executor = mock.patch('batteries.detail_cache.refresh_executor').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def name(self, **headers):
+        response = self.client.get(self.path, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['name']
+
+    def rename_quietly(self, name):
+        Battery.objects.filter(pk=self.battery.pk).update(name=name)
+
+    def test_served_from_cache(self):
+        self.assertEqual(self.name(), 'Power Max 0')
+        self.rename_quietly('Renamed')
+        self.assertEqual(self.name(), 'Power Max 0')
+        self.assertEqual(self.name(HTTP_HOST='shop.example.com'), 'Renamed')
+
+    def test_write_rerenders_hot_pages_after_commit(self):
+        self.name()
+        self.name(HTTP_HOST='shop.example.com')
+        self.battery.name = 'Renamed'
+        self.battery.save()
+        rerender, pages = self.executor.return_value.submit.call_args.args
+        self.assertEqual(sorted(pages), [('power-max-0', 'http://shop.example.com'), ('power-max-0', 'http://testserver')])
+        # Run the re-render as the refresh thread would; later reads are then served from it
+        rerender(pages)
+        self.rename_quietly('Quietly renamed')
+        self.assertEqual(self.name(), 'Renamed')
+        self.assertEqual(self.name(HTTP_HOST='shop.example.com'), 'Renamed')
+
+    def test_read_racing_a_write_is_not_kept(self):
+        with transaction.atomic():
+            detail_cache.refresh([self.battery.slug])
+            # A concurrent read renders the old row after the first invalidation
+            self.assertEqual(self.name(), 'Power Max 0')
+            self.rename_quietly('Renamed')
+        self.assertEqual(self.name(), 'Renamed')
+
+class WarmupTests(CatalogTestCase):
+    """Warm-up builds the row serializers too and leaves the hottest pages in the cache"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+
+    def test_serializers_include_row_serializers(self):
+        classes = set(warmup.serializer_classes())
+        self.assertTrue({BatteryRowSerializer, BrandRowSerializer, CategoryRowSerializer} <= classes)
+        self.assertNotIn(RowSerializer, classes)
+        with mock.patch.object(BatteryRowSerializer, 'get_extractors', autospec=True, return_value={}) as get_extractors:
+            warmup.warm_serializers()
+        get_extractors.assert_called_once()
+
+    def test_warm_data_fills_caches(self):
+        output = StringIO()
+        call_command('warm_caches', base_url='http://testserver', details=2, stdout=output)
+        self.assertIn('battery details', output.getvalue())
+        Battery.objects.update(name='Renamed')
+        client = APIClient()
+        self.assertNotIn('Renamed', client.get('/api/batteries/featured/').content.decode())
+        top = warmup.top_battery_paths(2)
+        self.assertEqual(client.get(top[0]).json()['name'][:9], 'Power Max')
+
+class CreateOrderTests(CatalogTestCase):
+    """Order totals are exact Decimals, and a rejected cart writes nothing"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+        self.cheap = self.batteries[3]
+        Battery.objects.filter(pk=self.cheap.pk).update(price=Decimal('120.25'), stock_quantity=5)
+        self.user = User.objects.create_user('buyer', password='buyer-pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, *lines):
+        return self.client.post('/api/orders/create/', {
+            'shipping_address': '1 Moi Avenue', 'shipping_city': 'Nairobi', 'shipping_postal_code': '00100',
+            'shipping_country': 'Kenya', 'phone_number': '0700000000',
+            'items': [{'battery_id': str(battery_id), 'quantity': quantity} for battery_id, quantity in lines],
+        }, format='json')
+
+    def test_totals_without_shipping(self):
+        response = self.order((self.batteries[1].pk, 1), (self.batteries[2].pk, 2))
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(
+            (order.subtotal, order.shipping_cost, order.tax_amount, order.total_amount),
+            (Decimal('28248.50'), Decimal('0.00'), Decimal('2824.85'), Decimal('31073.35')),
+        )
+        self.assertEqual(
+            sorted(order.items.values_list('quantity', 'unit_price', 'total_price')),
+            [(1, Decimal('9249.50'), Decimal('9249.50')), (2, Decimal('9499.50'), Decimal('18999.00'))],
+        )
+        self.assertEqual(Battery.objects.get(pk=self.batteries[2].pk).stock_quantity, 0)
+
+    def test_shipping_and_tax_rounded_half_up_below_threshold(self):
+        self.assertEqual(self.order((self.cheap.pk, 1)).status_code, 201)
+        order = Order.objects.get(user=self.user)
+        # 10% of 120.25 is 12.025, which rounds half-up to 12.03
+        self.assertEqual(
+            (order.subtotal, order.shipping_cost, order.tax_amount, order.total_amount),
+            (Decimal('120.25'), Decimal('50.00'), Decimal('12.03'), Decimal('182.28')),
+        )
+
+    def test_missing_and_inactive_batteries(self):
+        missing = uuid.uuid4()
+        response = self.order((missing, 1), (self.batteries[-1].pk, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            sorted(response.json()['items']),
+            [f'Battery {missing} does not exist.', 'Power Max 7 is no longer available.'],
+        )
+        self.assertFalse(Order.objects.exists())
+
+    def test_quantity_validation(self):
+        for lines in [(), ((self.cheap.pk, 0),), ((self.cheap.pk, -1),)]:
+            with self.subTest(lines=lines):
+                self.assertEqual(self.order(*lines).status_code, 400)
+        # Lines for the same battery are checked against its stock together
+        response = self.order((self.cheap.pk, 3), (self.cheap.pk, 3))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'], ['Not enough stock for Power Max 3.'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Battery.objects.get(pk=self.cheap.pk).stock_quantity, 5)
+
+    def test_rolls_back_when_stock_sells_out_after_validation(self):
+        # Another checkout takes the last units between validation and the reservation
+        with mock.patch.object(inventory, 'reserve', side_effect=inventory.InsufficientStock(self.cheap.pk)):
+            response = self.order((self.batteries[1].pk, 1), (self.cheap.pk, 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'items': ['Not enough stock for Power Max 3.']})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(Battery.objects.get(pk=self.cheap.pk).stock_quantity, 5)
+
+
+class StockTests(CatalogTestCase):
+    """Checkouts take stock with queryset updates; saves must not undo them and they must not touch the battery version"""
+
+    def setUp(self):
+        super().setUp()
+        self.batteries = create_catalog()
+        self.battery = self.batteries[2]
+        self.buyer = User.objects.create_user('buyer', password='buyer-pass')
+
+    def take(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            order = Order.objects.create(
+                user=self.buyer, subtotal=0, shipping_cost=0, tax_amount=0, total_amount=0,
+                shipping_address='1 Moi Avenue', shipping_city='Nairobi', shipping_postal_code='00100',
+                shipping_country='Kenya', phone_number='0700000000',
+            )
+            inventory.reserve({self.battery.pk: quantity}, order)
+
+    def test_stale_save_keeps_reserved_stock(self):
+        stale = Battery.objects.get(pk=self.battery.pk)
+        self.take(2)
+        stale.name = 'Renamed'
+        stale.save()
+        stored = Battery.objects.get(pk=self.battery.pk)
+        self.assertEqual((stored.name, stored.stock_quantity), ('Renamed', 0))
+        self.assertFalse(InventoryMovement.objects.filter(battery=self.battery, reason='adjustment').exists())
+        self.assertEqual(inventory.stock_drift(), {})
+        self.assertEqual(stats.read_stats(), stats.compute_stats())
+
+    def test_edited_stock_is_written(self):
+        stale = Battery.objects.get(pk=self.battery.pk)
+        self.take(2)
+        stale.stock_quantity = 5
+        stale.save()
+        self.assertEqual(Battery.objects.get(pk=self.battery.pk).stock_quantity, 5)
+        self.assertEqual(
+            list(InventoryMovement.objects.filter(battery=self.battery, reason='adjustment').values_list('quantity', flat=True)),
+            [5],
+        )
+        self.assertEqual(inventory.stock_drift(), {})
+
+    def test_checkout_bumps_stock_not_battery(self):
+        # Signed in, so the list skips the response cache but not the count cache or ETags
+        client = APIClient()
+        client.login(username='buyer', password='buyer-pass')
+        suggestion_index.current()
+        built_from = suggestion_index.versions
+        before = versioning.get_versions(['battery', 'stock'], max_age=0)
+        self.assertEqual(client.get('/api/batteries/', {'in_stock': 'true'}).json()['count'], 5)
+        listed = client.get('/api/batteries/')
+        self.assertTrue(self.find(listed.json()['results'])['is_in_stock'])
+        self.assertEqual(APIClient().get('/api/dashboard/stats/').json()['in_stock_batteries'], 5)
+
+        self.take(2)
+
+        after = versioning.get_versions(['battery', 'stock'], max_age=0)
+        self.assertEqual((after['battery'], after['stock']), (before['battery'], before['stock'] + 1))
+        self.assertIs(suggestion_index.versions, built_from)
+        self.assertEqual(client.get('/api/batteries/', {'in_stock': 'true'}).json()['count'], 4)
+        self.assertEqual(client.get('/api/batteries/', HTTP_IF_NONE_MATCH=listed['ETag']).status_code, 200)
+        self.assertFalse(self.find(client.get('/api/batteries/').json()['results'])['is_in_stock'])
+        self.assertEqual(APIClient().get('/api/dashboard/stats/').json()['in_stock_batteries'], 4)
+
+    def find(self, results):
+        return next(row for row in results if row['slug'] == self.battery.slug)
+
+
+class ConcurrentCheckoutTests(CatalogTransactionTestCase):
+    """Many buyers checking out the last units of one battery at once must not oversell it"""
+
+    stock = 10
+    buyers = 24
+
+    def setUp(self):
+        super().setUp()
+        self.battery = create_catalog(battery_count=2)[0]
+        Battery.objects.filter(pk=self.battery.pk).update(stock_quantity=self.stock)
+        InventoryMovement.objects.filter(battery=self.battery).delete()
+        InventoryMovement.objects.create(battery=self.battery, quantity=self.stock, reason='initial')
+        self.users = [User.objects.create_user(f'buyer{i}', password='buyer-pass') for i in range(self.buyers)]
+
+    def checkout(self, user, statuses, start):
+        client = APIClient()
+        client.force_authenticate(user)
+        start.wait()
+        try:
+            response = client.post('/api/orders/create/', {
+                'shipping_address': '1 Moi Avenue', 'shipping_city': 'Nairobi', 'shipping_postal_code': '00100',
+                'shipping_country': 'Kenya', 'phone_number': '0700000000',
+                'items': [{'battery_id': str(self.battery.pk), 'quantity': 1}],
+            }, format='json')
+            statuses.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    def test_stock_is_never_oversold(self):
+        statuses = []
+        start = threading.Barrier(self.buyers)
+        threads = [threading.Thread(target=self.checkout, args=(user, statuses, start)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(statuses.count(400), self.buyers - self.stock)
+        self.battery.refresh_from_db()
+        self.assertEqual(self.battery.stock_quantity, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(inventory.stock_drift(), {})
@@ -7,6 +7,8 @@ urlpatterns = [
 
     # Batteries
     path('batteries/', views.BatteryListView.as_view(), name='battery-list'),
+    path('batteries/facets/', views.BatteryFacetsView.as_view(), name='battery-facets'),
+    path('batteries/fit/', views.BatteryFitView.as_view(), name='battery-fit'),
     path('batteries/featured/', views.FeaturedBatteriesView.as_view(), name='featured-batteries'),
     path('batteries/popular/', views.PopularBatteriesView.as_view(), name='popular-batteries'),
     path('batteries/<slug:slug>/', views.BatteryDetailView.as_view(), name='battery-detail'),
@@ -18,6 +20,8 @@ urlpatterns = [
 
     # Reviews
     path('batteries/<uuid:battery_id>/reviews/', views.BatteryReviewListView.as_view(), name='battery-reviews'),
+    path('batteries/<uuid:battery_id>/equivalents/', views.battery_equivalents, name='battery-equivalents'),
+    path('batteries/<uuid:battery_id>/rating-histogram/', views.battery_rating_histogram, name='battery-rating-histogram'),
     path('reviews/create/', views.CreateReviewView.as_view(), name='create-review'),
 
     # Orders
@@ -0,0 +1,109 @@
+"""Catalog version counters shared by every worker process.
+
+Each data set ("battery", "brand", ...) has a ``CatalogVersion`` row whose
+counter is bumped inside the writing transaction. Workers read all counters in
+one query, memoized for ``CATALOG_VERSION_TTL`` seconds, and compare them with
+the versions an in-process structure was built from. Every worker therefore
+converges on the latest data within the TTL without a shared cache.
+"""
+import abc
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CatalogVersion
+
+_memo = {'fetched_at': float('-inf'), 'versions': {}}
+
+
+def version_ttl():
+    return getattr(settings, 'CATALOG_VERSION_TTL', 1.0)
+
+
+def get_versions(keys, max_age=None):
+    """Current counters for ``keys``; unknown keys report 0"""
+    max_age = version_ttl() if max_age is None else max_age
+    memo = _memo
+    if time.monotonic() - memo['fetched_at'] > max_age:
+        fetched_at = time.monotonic()
+        memo = {'fetched_at': fetched_at, 'versions': dict(CatalogVersion.objects.values_list('key', 'version'))}
+        _memo.update(memo)
+    return {key: memo['versions'].get(key, 0) for key in keys}
+
+
+def bump(*keys):
+    """Advance the counters for ``keys`` and return their new values"""
+    with transaction.atomic():
+        for key in keys:
+            if not CatalogVersion.objects.filter(key=key).update(version=F('version') + 1):
+                try:
+                    with transaction.atomic():
+                        CatalogVersion.objects.create(key=key, version=1)
+                except IntegrityError:
+                    CatalogVersion.objects.filter(key=key).update(version=F('version') + 1)
+        versions = dict(CatalogVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    # This process must see its own writes immediately
+    _memo['fetched_at'] = float('-inf')
+    return versions
+
+
+class VersionedIndex(abc.ABC):
+    """In-process structure rebuilt whenever one of its ``version_keys`` changes.
+
+    Subclasses implement ``build()``. Writers in the same process may call
+    ``patch()`` from ``transaction.on_commit`` to update the structure in place
+    instead of forcing a full rebuild; readers of a patched structure go
+    through ``reading()`` so they never see it half-updated.
+    """
+    version_keys = ()
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.versions = None
+        self.state = None
+
+    @abc.abstractmethod
+    def build(self):
+        """The structure for the current data, stored as ``state``"""
+
+    def current(self):
+        versions = get_versions(self.version_keys)
+        # Read the state under the lock: a concurrent invalidate() clears it
+        with self.lock:
+            if versions != self.versions:
+                self.state = self.build()
+                self.versions = versions
+            return self.state
+
+    @contextmanager
+    def reading(self):
+        """The current state, held against patches until the block exits"""
+        with self.lock:
+            yield self.current()
+
+    def invalidate(self):
+        with self.lock:
+            self.versions = None
+            self.state = None
+
+    def patch(self, new_versions, apply):
+        """Apply an in-place update for a write that moved ``new_versions`` forward by one.
+
+        If the index was not built from exactly the preceding versions (another
+        process wrote in between) it is invalidated and rebuilt on next use.
+        Keys outside ``version_keys`` are ignored.
+        """
+        new_versions = {key: version for key, version in new_versions.items() if key in self.version_keys}
+        with self.lock:
+            current = self.versions
+            if current is None:
+                return
+            if any(current.get(key) != version - 1 for key, version in new_versions.items()):
+                self.invalidate()
+                return
+            apply(self.state)
+            self.versions = {**current, **new_versions}
@@ -1,29 +1,69 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Count
 from rest_framework import generics, filters, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as filters_rf
 
+from . import detail_cache
+from .caching import ETAG_META_KEY, CachedResponseMixin, ConditionalGetMixin, cache_response, conditional_get
+from .dimensions import fit_index
+from .equivalents import equivalent_ids
+from .fitment import vehicle_q, vehicle_text_q
+from .fuzzy import FuzzyMatchFilter, trigram_index
+from .pagination import CachedCountPagination, KeysetPagination, cursor_requested
+from .renderers import FastJSONRenderer, JSONFragment
+from .search import FullTextSearchFilter
+from .snapshot import catalog_snapshot, snapshot_enabled
+from .stats import read_stats
+from .suggestions import BATTERY_LIMIT, suggestion_index
 from .models import (
-    Battery, Brand, Category, Review, Order, OrderItem, Wishlist
+    Battery, Brand, Category, Review, Order, OrderItem, Wishlist, VehicleFitment
+)
+from .fast_serializers import (
+    BatteryRowSerializer, BrandRowSerializer, CategoryRowSerializer, category_row_context
 )
 from .serializers import (
     BatteryListSerializer, BatteryDetailSerializer, BrandSerializer,
     CategorySerializer, ReviewSerializer, CreateReviewSerializer,
-    OrderSerializer, CreateOrderSerializer, WishlistSerializer,
-    UserSerializer
+    OrderSerializer, CreateOrderSerializer, WishlistSerializer, FitSearchSerializer,
+    UserSerializer, brand_battery_counts, category_tree_context, expansion_context
 )
 
+# Catalog versions behind any response that embeds batteries (see batteries/versioning.py)
+BATTERY_VERSION_KEYS = ('battery', 'brand', 'category', 'review', 'image', 'stock')
+
 # ✅ Pagination
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CachedCountPagination):
     page_size = 12
     page_size_query_param = 'page_size'
     max_page_size = 50
 
+def paginated_response(view, items, serialize):
+    """Pages ``items`` with the view's paginator, serializing only the page through ``serialize``"""
+    page = view.paginate_queryset(items)
+    if page is not None:
+        return view.get_paginated_response(serialize(page))
+    return Response(serialize(items))
+
+class CursorPaginationMixin:
+    """Lets a request opt into keyset pagination with ``?pagination=cursor``"""
+    cursor_pagination_class = KeysetPagination
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if cursor_requested(self.request):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = None if self.pagination_class is None else self.pagination_class()
+        return self._paginator
+
 # ✅ Battery Filters
 class BatteryFilter(filters_rf.FilterSet):
     min_price = filters_rf.NumberFilter(field_name="price", lookup_expr='gte')
@@ -40,75 +80,317 @@ class BatteryFilter(filters_rf.FilterSet):
     max_cca = filters_rf.NumberFilter(field_name="cold_cranking_amps", lookup_expr='lte')
     in_stock = filters_rf.BooleanFilter(method='filter_in_stock')
     vehicle_search = filters_rf.CharFilter(method='filter_vehicle_compatibility')
+    # make/model/year must match the same fitment row, so they are applied together in filter_queryset
+    make = filters_rf.CharFilter(method='defer_to_fitment')
+    model = filters_rf.CharFilter(method='defer_to_fitment')
+    year = filters_rf.NumberFilter(method='defer_to_fitment')
     
     class Meta:
         model = Battery
         fields = ['is_featured', 'is_popular', 'brand']
     
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fitment = {name: self.form.cleaned_data.get(name) for name in ('make', 'model', 'year')}
+        if any(fitment.values()):
+            queryset = self.filter_fitment(queryset, vehicle_q(**fitment))
+        return queryset
+    
+    def defer_to_fitment(self, queryset, name, value):
+        return queryset
+    
+    def filter_fitment(self, queryset, condition):
+        return queryset.filter(pk__in=VehicleFitment.objects.filter(condition).values('battery_id'))
+    
     def filter_in_stock(self, queryset, name, value):
         if value:
             return queryset.filter(stock_quantity__gt=0)
         return queryset
     
     def filter_vehicle_compatibility(self, queryset, name, value):
-        return queryset.filter(
-            Q(compatible_vehicles__icontains=value) |
-            Q(vehicle_makes__icontains=value) |
-            Q(vehicle_models__icontains=value)
-        )
+        return self.filter_fitment(queryset, vehicle_text_q(value))
+
+class ExpansionContextMixin:
+    """Bulk-loads what ``?expand=`` needs so full brand/category embeds stay query-free per row"""
+    
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **expansion_context(self.request)}
+
+class FastListMixin:
+    """Serializes list pages from ``.values()`` rows when BATTERIES_FAST_SERIALIZATION is on.
+
+    Requests that ask for ``?expand=`` go through the regular serializer.
+    """
+    row_serializer_class = None
+    
+    def use_row_serializer(self):
+        return getattr(settings, 'BATTERIES_FAST_SERIALIZATION', False) and 'expand' not in self.request.query_params
+    
+    def list(self, request, *args, **kwargs):
+        if not self.use_row_serializer():
+            return super().list(request, *args, **kwargs)
+        row_serializer = self.row_serializer_class(context=self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.select_related(None).prefetch_related(None).values(*row_serializer.columns)
+        return paginated_response(self, rows, row_serializer.serialize)
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """Breaks ties on the primary key, in the direction of the last ordering field.
+
+    Pages stay disjoint under any ordering, and the catalog snapshot and keyset
+    pagination break ties the same way.
+    """
+    
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        pk_name = queryset.model._meta.pk.name
+        if ordering and not {'pk', pk_name} & {term.lstrip('-') for term in ordering}:
+            ordering = [*ordering, ('-' if ordering[-1].startswith('-') else '') + pk_name]
+        return ordering
+
+class RankedIdsListMixin:
+    """Pages over an ordered list of battery ids from ``ranked_ids()``, loading only each page's rows.
+
+    Counts and pagination cover the whole list, however long. When
+    ``ranked_ids()`` returns None the view lists its queryset as usual.
+    """
+    
+    def ranked_ids(self):
+        return None
+    
+    def hydrate(self, battery_ids):
+        """Serialized batteries for ``battery_ids`` in that order"""
+        queryset = self.get_queryset().filter(pk__in=battery_ids)
+        if self.use_row_serializer():
+            row_serializer = self.row_serializer_class(context=self.get_serializer_context())
+            rows = {row['id']: row for row in queryset.select_related(None).prefetch_related(None).values(*row_serializer.columns)}
+            return row_serializer.serialize([rows[pk] for pk in battery_ids if pk in rows])
+        batteries = queryset.in_bulk()
+        return self.get_serializer([batteries[pk] for pk in battery_ids if pk in batteries], many=True).data
+    
+    def list(self, request, *args, **kwargs):
+        battery_ids = self.ranked_ids()
+        if battery_ids is None:
+            return super().list(request, *args, **kwargs)
+        return paginated_response(self, battery_ids, self.hydrate)
+
+class SnapshotListMixin(RankedIdsListMixin):
+    """Answers range-filtered battery lists from the in-memory catalog snapshot.
+
+    Only requests limited to the snapshot's filters and a single supported
+    ordering take this path; the page's rows are then loaded by primary key.
+    Anything else, including invalid filter values, goes through the queryset.
+    """
+    passthrough_params = {'page', 'page_size', 'format', 'expand', 'ordering'}
+    
+    def ranked_ids(self):
+        battery_ids = self.snapshot_ids()
+        return super().ranked_ids() if battery_ids is None else battery_ids
+    
+    def snapshot_ids(self):
+        if not snapshot_enabled() or not isinstance(self.paginator, PageNumberPagination):
+            return None
+        params = set(self.request.query_params) - self.passthrough_params
+        ordering = filters.OrderingFilter().get_ordering(self.request, self.get_queryset(), self)
+        if not ordering or len(ordering) != 1 or not catalog_snapshot.supports(params, ordering[0]):
+            return None
+        filterset = self.filterset_class(self.request.query_params, queryset=self.get_queryset(), request=self.request)
+        if not filterset.is_valid():
+            return None
+        cleaned = {param: filterset.form.cleaned_data.get(param) for param in params}
+        return catalog_snapshot.matching_ids(cleaned, ordering[0])
+
+class FuzzyListMixin(RankedIdsListMixin):
+    """Ranks ``?fuzzy=`` results by similarity when no explicit ordering is requested.
+
+    The other filters run as one query for the matching ids, which are then
+    paged in the trigram index's order.
+    """
+    
+    def ranked_ids(self):
+        if api_settings.ORDERING_PARAM in self.request.query_params or not isinstance(self.paginator, PageNumberPagination):
+            return super().ranked_ids()
+        matched = FuzzyMatchFilter().ranked_ids(self.request)
+        if matched is None:
+            return super().ranked_ids()
+        queryset = self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None).order_by()
+        kept = set(queryset.values_list('pk', flat=True))
+        return [pk for pk in matched if pk in kept]
 
 # ✅ Battery Views
-class BatteryListView(generics.ListAPIView):
+class BatteryListView(ConditionalGetMixin, CachedResponseMixin, CursorPaginationMixin, FuzzyListMixin, SnapshotListMixin, FastListMixin, ExpansionContextMixin, generics.ListAPIView):
     queryset = Battery.objects.filter(is_active=True).select_related('brand').prefetch_related('categories')
     serializer_class = BatteryListSerializer
+    row_serializer_class = BatteryRowSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    etag_version_keys = BATTERY_VERSION_KEYS
+    cache_tags = ('batteries', 'brands', 'categories', 'category-links', 'battery-images', 'reviews', 'stock')
+    cache_stale_timeout = 30
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter, FullTextSearchFilter, FuzzyMatchFilter]
     filterset_class = BatteryFilter
     search_fields = ['name', 'model_number', 'brand__name', 'description', 'short_description', 'compatible_vehicles']
-    ordering_fields = ['price', 'created_at', 'name', 'amp_hours', 'cold_cranking_amps']
+    ordering_fields = ['price', 'created_at', 'name', 'amp_hours', 'cold_cranking_amps', 'average_rating', 'review_count']
     ordering = ['-created_at']
+    
+    @property
+    def count_version_keys(self):
+        # Stock only changes which batteries match when filtering on it
+        keys = ('battery', 'brand', 'category')
+        return (*keys, 'stock') if 'in_stock' in self.request.query_params else keys
+
+class BatteryFacetsView(BatteryListView):
+    """Per-value counts for brand, voltage, condition and category_type over the filtered battery set.
+
+    Accepts the same filter and search parameters as BatteryListView. The
+    battery-level facets come from one grouped query over their combinations
+    and category_type from one grouped query over the category links.
+    """
+    facet_fields = {'brand': 'brand__name', 'voltage': 'voltage', 'condition': 'condition'}
+    
+    def list(self, request, *args, **kwargs):
+        matched_ids = self.filter_queryset(self.get_queryset()).order_by().values('pk')
+        
+        facets = {name: {} for name in [*self.facet_fields, 'category_type']}
+        total = 0
+        combinations = Battery.objects.filter(pk__in=matched_ids).order_by().values(
+            *self.facet_fields.values()
+        ).annotate(count=Count('pk'))
+        for row in combinations:
+            total += row['count']
+            for name, field in self.facet_fields.items():
+                facets[name][row[field]] = facets[name].get(row[field], 0) + row['count']
+        
+        category_types = Battery.categories.through.objects.filter(battery_id__in=matched_ids).order_by().values(
+            'category__category_type'
+        ).annotate(count=Count('battery_id', distinct=True))
+        for row in category_types:
+            facets['category_type'][row['category__category_type']] = row['count']
+        
+        return Response({
+            'count': total,
+            'facets': {
+                name: [
+                    {'value': value, 'count': count}
+                    for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+                ]
+                for name, counts in facets.items()
+            },
+        })
 
-class FeaturedBatteriesView(generics.ListAPIView):
+class BatteryFitView(ConditionalGetMixin, RankedIdsListMixin, FastListMixin, ExpansionContextMixin, generics.ListAPIView):
+    """Batteries that fit a tray, e.g. ``?length=24&width=17&height=20&min_amp_hours=45&min_cca=400``.
+
+    Each dimension may exceed the tray by ``tolerance`` and fall short by
+    ``max_gap`` cm. Results are ordered from the snuggest fit.
+    """
+    queryset = Battery.objects.filter(is_active=True).select_related('brand').prefetch_related('categories')
+    serializer_class = BatteryListSerializer
+    row_serializer_class = BatteryRowSerializer
+    pagination_class = StandardResultsSetPagination
+    etag_version_keys = BATTERY_VERSION_KEYS
+    
+    def ranked_ids(self):
+        params = FitSearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return fit_index.search(**params.validated_data)
+
+class FeaturedBatteriesView(ConditionalGetMixin, CachedResponseMixin, FastListMixin, ExpansionContextMixin, generics.ListAPIView):
     queryset = Battery.objects.filter(is_active=True, is_featured=True).select_related('brand').prefetch_related('categories')
     serializer_class = BatteryListSerializer
+    row_serializer_class = BatteryRowSerializer
     pagination_class = StandardResultsSetPagination
+    count_version_keys = ('battery', 'brand', 'category')
+    etag_version_keys = BATTERY_VERSION_KEYS
+    cache_tags = ('batteries', 'brands', 'categories', 'category-links', 'battery-images', 'reviews', 'stock')
+    cache_stale_timeout = 30
 
-class PopularBatteriesView(generics.ListAPIView):
+class PopularBatteriesView(ConditionalGetMixin, CachedResponseMixin, FastListMixin, ExpansionContextMixin, generics.ListAPIView):
     queryset = Battery.objects.filter(is_active=True, is_popular=True).select_related('brand').prefetch_related('categories')
     serializer_class = BatteryListSerializer
+    row_serializer_class = BatteryRowSerializer
     pagination_class = StandardResultsSetPagination
+    count_version_keys = ('battery', 'brand', 'category')
+    etag_version_keys = BATTERY_VERSION_KEYS
+    cache_tags = ('batteries', 'brands', 'categories', 'category-links', 'battery-images', 'reviews', 'stock')
+    cache_stale_timeout = 30
 
-class BatteryDetailView(generics.RetrieveAPIView):
-    queryset = Battery.objects.filter(is_active=True).select_related('brand', 'seller').prefetch_related('categories', 'images', 'reviews')
+class BatteryDetailView(ConditionalGetMixin, ExpansionContextMixin, generics.RetrieveAPIView):
+    """Served from the write-through page cache in batteries/detail_cache.py when enabled"""
+    queryset = Battery.objects.filter(is_active=True).select_related('brand', 'seller').prefetch_related('categories', 'images', 'reviews__user')
     serializer_class = BatteryDetailSerializer
     lookup_field = 'slug'
+    etag_version_keys = BATTERY_VERSION_KEYS
+    
+    def retrieve(self, request, *args, **kwargs):
+        slug = self.kwargs['slug']
+        if not detail_cache.cacheable(request) or not isinstance(request.accepted_renderer, FastJSONRenderer) \
+                or 'indent' in (request.accepted_media_type or ''):
+            return super().retrieve(request, *args, **kwargs)
+        page = detail_cache.get(slug, request)
+        if page is None:
+            page_version = detail_cache.version(slug)
+            data = super().retrieve(request, *args, **kwargs).data
+            content = request.accepted_renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+            page = content, request.META.get(ETAG_META_KEY)
+            detail_cache.store(slug, request, page_version, *page)
+        content, etag = page
+        response = Response(JSONFragment(content))
+        if etag:
+            response['ETag'] = etag
+        return response
 
 # ✅ Brands & Categories
-class BrandListView(generics.ListAPIView):
+class BrandListView(ConditionalGetMixin, CachedResponseMixin, FastListMixin, generics.ListAPIView):
     queryset = Brand.objects.all().order_by('name')
     serializer_class = BrandSerializer
+    row_serializer_class = BrandRowSerializer
+    cache_tags = ('brands', 'batteries')
+    etag_version_keys = ('brand', 'battery')
+    
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'brand_battery_counts': brand_battery_counts()}
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     serializer_class = CategorySerializer
+    cache_tags = ('categories', 'category-links', 'batteries')
+    etag_version_keys = ('category', 'battery')
     
     def get_queryset(self):
+        return Category.objects.filter(is_active=True).order_by('display_order', 'name')
+    
+    def filter_categories(self, rows):
         category_type = self.request.query_params.get('type', None)
         parent_id = self.request.query_params.get('parent', None)
         
-        queryset = Category.objects.filter(is_active=True)
-        
         if category_type:
-            queryset = queryset.filter(category_type=category_type)
+            rows = [row for row in rows if row['category_type'] == category_type]
         if parent_id:
-            queryset = queryset.filter(parent_category_id=parent_id)
+            rows = [row for row in rows if str(row['parent_category_id']) == parent_id]
         elif parent_id is None and not category_type:
-            queryset = queryset.filter(parent_category__isnull=True)
+            rows = [row for row in rows if row['parent_category_id'] is None]
+        
+        return rows
+    
+    def list(self, request, *args, **kwargs):
+        # Load every active category once as rows and assemble the tree in memory
+        rows = list(self.get_queryset().values(*CategoryRowSerializer.columns))
+        selected = self.filter_categories(rows)
+        if getattr(settings, 'BATTERIES_FAST_SERIALIZATION', False):
+            context = {**self.get_serializer_context(), **category_row_context(rows)}
+            return paginated_response(self, selected, CategoryRowSerializer(context=context).serialize)
         
-        return queryset.order_by('display_order', 'name')
+        categories = {row['id']: Category(**row) for row in rows}
+        context = {**self.get_serializer_context(), **category_tree_context(categories.values())}
+        serializer_class = self.get_serializer_class()
+        return paginated_response(
+            self, selected,
+            lambda page: serializer_class([categories[row['id']] for row in page], many=True, context=context).data,
+        )
 
 # ✅ Reviews
-class BatteryReviewListView(generics.ListAPIView):
+class BatteryReviewListView(ConditionalGetMixin, CursorPaginationMixin, generics.ListAPIView):
     serializer_class = ReviewSerializer
+    etag_version_keys = ('review',)
     
     def get_queryset(self):
         battery_id = self.kwargs['battery_id']
@@ -119,10 +401,11 @@ class CreateReviewView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 # ✅ Orders
-class OrderListView(generics.ListAPIView):
+class OrderListView(ConditionalGetMixin, CursorPaginationMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    etag_version_keys = ('order', *BATTERY_VERSION_KEYS)
     
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user).prefetch_related('items__battery')
@@ -131,17 +414,19 @@ class CreateOrderView(generics.CreateAPIView):
     serializer_class = CreateOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class OrderDetailView(generics.RetrieveAPIView):
+class OrderDetailView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_version_keys = ('order', *BATTERY_VERSION_KEYS)
     
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user).prefetch_related('items__battery')
 
 # ✅ Wishlist
-class WishlistView(generics.ListAPIView):
+class WishlistView(ConditionalGetMixin, ExpansionContextMixin, generics.ListAPIView):
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_version_keys = ('wishlist', *BATTERY_VERSION_KEYS)
     
     def get_queryset(self):
         return Wishlist.objects.filter(user=self.request.user).select_related('battery__brand').prefetch_related('battery__categories')
@@ -171,40 +456,33 @@ def remove_from_wishlist(request, battery_id):
         return Response({'error': 'Battery not in wishlist'}, status=status.HTTP_404_NOT_FOUND)
 
 # ✅ Search & Dashboard
+@conditional_get('battery', 'brand')
 @api_view(['GET'])
 def search_suggestions(request):
     query = request.GET.get('q', '')
     if len(query) < 2:
         return Response([])
     
-    batteries = Battery.objects.filter(
-        Q(name__icontains=query) |
-        Q(brand__name__icontains=query) |
-        Q(model_number__icontains=query),
-        is_active=True
-    ).select_related('brand')[:10]
-    
-    suggestions = [
-        {'text': f"{b.brand.name} {b.name}", 'type': 'battery', 'slug': b.slug}
-        for b in batteries
-    ]
-    for brand in Brand.objects.filter(name__icontains=query)[:5]:
-        suggestions.append({'text': brand.name, 'type': 'brand', 'slug': brand.name.lower().replace(' ', '-')})
+    suggestions = suggestion_index.suggest(query)
+    batteries = [s for s in suggestions if s['type'] == 'battery']
+    brands = [s for s in suggestions if s['type'] == 'brand']
+    if len(batteries) < BATTERY_LIMIT:
+        # Top up with typo-tolerant matches such as "ns40 zl" for "NS40ZL"
+        seen = {s['slug'] for s in batteries}
+        for suggestion in trigram_index.suggestions(query, BATTERY_LIMIT):
+            if suggestion['slug'] not in seen and len(batteries) < BATTERY_LIMIT:
+                seen.add(suggestion['slug'])
+                batteries.append(suggestion)
     
-    return Response(suggestions)
+    return Response(batteries + brands)
 
+@conditional_get('battery', 'brand', 'category', 'stock')
+@cache_response('batteries', 'brands', 'categories', 'stock')
 @api_view(['GET'])
 def dashboard_stats(request):
-    stats = {
-        'total_batteries': Battery.objects.filter(is_active=True).count(),
-        'featured_batteries': Battery.objects.filter(is_active=True, is_featured=True).count(),
-        'popular_batteries': Battery.objects.filter(is_active=True, is_popular=True).count(),
-        'total_brands': Brand.objects.count(),
-        'total_categories': Category.objects.count(),
-        'in_stock_batteries': Battery.objects.filter(is_active=True, stock_quantity__gt=0).count(),
-    }
-    return Response(stats)
+    return Response(read_stats())
 
+@conditional_get('battery')
 @api_view(['GET'])
 def battery_specifications(request, battery_id):
     try:
@@ -229,7 +507,33 @@ def battery_specifications(request, battery_id):
     except Battery.DoesNotExist:
         return Response({'error': 'Battery not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@conditional_get('battery', 'review')
+@api_view(['GET'])
+def battery_rating_histogram(request, battery_id):
+    try:
+        battery = Battery.objects.only('id', *Battery.REVIEW_STATS_FIELDS).get(id=battery_id, is_active=True)
+    except Battery.DoesNotExist:
+        return Response({'error': 'Battery not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'average_rating': round(battery.average_rating, 1) if battery.review_count else 0,
+        'review_count': battery.review_count,
+        'histogram': battery.rating_histogram,
+    })
+
+@conditional_get('equivalents', *BATTERY_VERSION_KEYS)
+@api_view(['GET'])
+def battery_equivalents(request, battery_id):
+    """Active batteries with the same voltage and the closest specs, closest first"""
+    if not Battery.objects.filter(id=battery_id, is_active=True).exists():
+        return Response({'error': 'Battery not found'}, status=status.HTTP_404_NOT_FOUND)
+    ranked_ids = equivalent_ids(battery_id)
+    # Only the ids are cached, so price and stock are always current
+    batteries = Battery.objects.filter(is_active=True).select_related('brand').prefetch_related('categories').in_bulk(ranked_ids)
+    found = [batteries[pk] for pk in ranked_ids if pk in batteries]
+    return Response(BatteryListSerializer(found, many=True, context={'request': request}).data)
+
 # ✅ API Root
+@conditional_get()
 @api_view(['GET'])
 def api_root(request, format=None):
     return Response({
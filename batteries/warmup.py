@@ -0,0 +1,125 @@
+"""Start-up warm-up for worker processes.
+
+A fresh process pays on its first requests for lazy imports, the URL
+resolver, serializer field construction, the in-process search indexes and
+empty response caches. ``warm_code`` covers the first three, including the
+row serializers' extractors, and suits the gunicorn master before it forks
+(see gunicorn.conf.py), so every worker inherits the result. ``warm_data``
+builds the indexes and renders the hottest catalog pages through their
+views, filling the response and detail caches for ``base_url``. Run from
+``manage.py warm_caches``, those pages land in the shared cache configured
+by ``CACHES``; with a per-process backend such as LocMemCache they would be
+discarded when the command exits. Each step is timed; both return
+``[(step, seconds, note)]``.
+"""
+import inspect
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.urls import get_resolver, reverse
+from rest_framework import serializers as drf_serializers
+
+from . import fast_serializers, serializers
+from .caching import internal_get
+from .dimensions import fit_index
+from .fuzzy import trigram_index
+from .models import Battery
+from .snapshot import catalog_snapshot, snapshot_enabled
+from .suggestions import suggestion_index
+
+# URL names of the catalog lists warmed by ``warm_responses``
+WARM_LIST_URLS = ('category-list', 'brand-list', 'featured-batteries', 'popular-batteries', 'battery-list', 'dashboard-stats')
+
+
+def warmup_details_count():
+    return getattr(settings, 'CACHE_WARMUP_DETAILS', 50)
+
+
+def warmup_base_url():
+    return getattr(settings, 'CACHE_WARMUP_BASE_URL', 'http://localhost:8000')
+
+
+@contextmanager
+def timed(timings, step):
+    note = []
+    started = time.perf_counter()
+    yield note
+    timings.append((step, time.perf_counter() - started, ', '.join(note)))
+
+
+def serializer_classes():
+    """The DRF serializers and concrete row serializers defined by this app"""
+    for module in (serializers, fast_serializers):
+        for value in vars(module).values():
+            if (isinstance(value, type) and issubclass(value, (drf_serializers.Serializer, fast_serializers.RowSerializer))
+                    and value.__module__ == module.__name__ and not inspect.isabstract(value)):
+                yield value
+
+
+def warm_serializers():
+    """Build each serializer's field map or row extractors once, loading model metadata and lazy imports"""
+    built = 0
+    for serializer_class in serializer_classes():
+        try:
+            serializer = serializer_class(context={})
+            # Row serializers call get_extractors() when constructed
+            if isinstance(serializer, drf_serializers.Serializer):
+                serializer.fields
+        except Exception:
+            # Serializers needing a request or other context are warmed by the responses instead
+            continue
+        built += 1
+    return built
+
+
+def warm_urls():
+    resolver = get_resolver()
+    resolver.url_patterns
+    reverse('api-root')
+    return len(resolver.reverse_dict)
+
+
+def warm_indexes():
+    indexes = [suggestion_index, trigram_index, fit_index]
+    if snapshot_enabled():
+        indexes.append(catalog_snapshot)
+    for index in indexes:
+        index.current()
+    return len(indexes)
+
+
+def warm_responses(base_url, paths):
+    """Request each path as an anonymous GET through the middleware and its view; returns the status of each"""
+    return {path: internal_get(base_url, path).status_code for path in paths}
+
+
+def top_battery_paths(count):
+    slugs = Battery.objects.filter(is_active=True).order_by('-review_count', '-average_rating', 'pk').values_list('slug', flat=True)[:count]
+    return [reverse('battery-detail', kwargs={'slug': slug}) for slug in slugs]
+
+
+def warm_code():
+    timings = []
+    with timed(timings, 'url resolver') as note:
+        note.append(f'{warm_urls()} reverse entries')
+    with timed(timings, 'serializer field maps') as note:
+        note.append(f'{warm_serializers()} serializers')
+    return timings
+
+
+def warm_data(base_url=None, details=None):
+    base_url = base_url or warmup_base_url()
+    details = warmup_details_count() if details is None else details
+    timings = []
+    with timed(timings, 'in-process indexes') as note:
+        note.append(f'{warm_indexes()} indexes')
+    with timed(timings, 'catalog lists') as note:
+        statuses = warm_responses(base_url, [reverse(name) for name in WARM_LIST_URLS])
+        note.append(f'{len(statuses)} pages')
+        note.extend(f'{path} -> {status}' for path, status in statuses.items() if status != 200)
+    with timed(timings, 'battery details') as note:
+        statuses = warm_responses(base_url, top_battery_paths(details))
+        note.append(f'{len(statuses)} pages')
+        note.extend(f'{path} -> {status}' for path, status in statuses.items() if status != 200)
+    return timings
@@ -0,0 +1,41 @@
+"""Gunicorn settings: gunicorn backend.wsgi -c gunicorn.conf.py
+
+The app is loaded once in the master (``preload_app``), which then warms the
+URL resolver and serializer field maps so forked workers share them. Each
+worker builds its search indexes and renders the hottest catalog pages right
+after the fork, before it accepts requests. Timings go to the error log.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def log_timings(log, who, timings):
+    for step, seconds, note in timings:
+        log.info('warm-up (%s) %s: %.1f ms%s', who, step, seconds * 1000, f' ({note})' if note else '')
+
+
+def when_ready(server):
+    from django.db import connections
+
+    from batteries import warmup
+
+    log_timings(server.log, 'master', warmup.warm_code())
+    # Workers must not inherit the master's database connections
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    from batteries import warmup
+
+    try:
+        log_timings(server.log, f'worker {worker.pid}', warmup.warm_data())
+    except Exception:
+        server.log.exception('warm-up failed in worker %s', worker.pid)
+    finally:
+        connections.close_all()